@@ -334,9 +334,18 @@ std::string ClifMatcher::GetQualTypeClifName(QualType qual_type) const {
       (name == "::std::basic_string<char, ::std::char_traits<char>, ::std::allocator<char> >")) {  // NOLINT linelength
     name = "::std::string";
   }
+  if ((name == "::std::basic_string_view<char, char_traits<char> >") ||
+      (name == "::std::basic_string_view<char, ::std::char_traits<char> >")) {
+    name = "::std::string_view";
+  }
   return name;
 }
 
+bool ClifMatcher::IsStringViewType(QualType qual_type) const {
+  std::string name = GetQualTypeClifName(qual_type.getUnqualifiedType());
+  return name == "::std::string_view" || name == "::absl::string_view";
+}
+
 bool ClifMatcher::MatchAndSetAST(AST* clif_ast) {
   assert(ast_ != nullptr && "RunCompiler must be called prior to this.");
   int num_unmatched = MatchAndSetDecls(clif_ast->mutable_decls());
@@ -1132,7 +1141,10 @@ QualType ClifMatcher::HandleTypeMatchFlags(
     }
   }
   if (type_to_report->isReferenceType()) {
-    type_to_report = flags & TMF_UNCONVERTED_REF_TYPE ?
+    // Keep a string view (not the clif std::string) for a const view&
+    // parameter to avoid a copy.
+    type_to_report = (flags & TMF_UNCONVERTED_REF_TYPE &&
+                      !IsStringViewType(type_to_report->getPointeeType())) ?
         clif_qual_type : type_to_report->getPointeeType();
   }
   if (flags & TMF_REMOVE_CONST_POINTER_TYPE) {
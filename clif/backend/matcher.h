@@ -395,6 +395,10 @@ class ClifMatcher {
 
   std::string GetQualTypeClifName(clang::QualType qual_type) const;
 
+  // Is |qual_type| (absl|std)::string_view, which Python converts without a
+  // copy (for input parameters)?
+  bool IsStringViewType(clang::QualType qual_type) const;
+
   void SetCppTypeName(const std::string& name, protos::Type* type) const {
     type->set_cpp_type(name);
   }
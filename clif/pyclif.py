@@ -48,6 +48,16 @@ def _ParseCommandline(doc, argv):
   parser.add_argument('--py3output',
                       default=sys.version_info.major == 3, action='store_true',
                       help='Generate code for Python 3.4+')
+  parser.add_argument('--native_enums', default=False, action='store_true',
+                      help='Wrap C++ enums with int-derived CLIF runtime type'
+                      ' instead of enum.Enum/IntEnum')
+  parser.add_argument('--weakrefs', default=False, action='store_true',
+                      help='Support weak references to all wrapped class'
+                      ' instances (as if all classes are @weakref)')
+  parser.add_argument('--memory_stats', default=False, action='store_true',
+                      help='Count live wrapped class instances for the module'
+                      ' __clif_memory__() function and add __sizeof__ to all'
+                      ' classes')
   parser.add_argument('--matcher_bin',
                       default=(os.getenv('CLIF_MATCHER') or
                                sys.prefix+'/clang/bin/clif-matcher'),
@@ -104,7 +114,8 @@ def GenerateFrom(ast):
   modname = FLAGS.modname or StripExt(os.path.basename(ast.source
                                                       )).replace('-', '_')
   m = pyext.Module(modname, ast.typemaps, for_py3=FLAGS.py3output,
-                   indent=FLAGS.indent)
+                   indent=FLAGS.indent, native_enums=FLAGS.native_enums,
+                   weakrefs=FLAGS.weakrefs, memory_stats=FLAGS.memory_stats)
   inc_headers.append(os.path.basename(FLAGS.header_out))
   # Order of generators is important.
   if api_header:
@@ -203,10 +214,18 @@ def _ParseClifSource(stream, dump_path):
   if FLAGS.py3output:
     init = ['type str = `UnicodeFromBytes` as bytes',
             'type unicode = `UnicodeFromBytes` as bytes',
+            'type istr = `InternedStr` as bytes',
+            'type blob = `Blob` as bytes',
+            'type buffer = list',
+            'type ndarray = list',
             'from builtins import chr']
   else:
     init = ['type str = bytes',
             'type unicode = `UnicodeFromBytes` as bytes',
+            'type istr = `InternedStr` as bytes',
+            'type blob = `Blob` as bytes',
+            'type buffer = list',
+            'type ndarray = list',
             'from __builtin__ import chr']
   p = pytd2proto.Postprocessor(config_headers=FLAGS.prepend,
                                include_paths=FLAGS.include_paths,
@@ -79,7 +79,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -270,7 +270,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -473,7 +473,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -620,6 +620,7 @@ class ClassTest(unittest.TestCase):
           PyErr_SetString(PyExc_TypeError, "Base class path.python.Base is a dynamic (Python defined) class.");
           return false;
         }
+        if (!CheckBaseSlots(&pyStruct::wrapper_Type)) return false;
         if (PyType_Ready(&pyStruct::wrapper_Type) < 0) return false;
         Py_INCREF(&pyStruct::wrapper_Type);  // For PyModule_AddObject to steal.
         return true;
@@ -697,7 +698,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyOuter {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<OutKlass> cpp;
       };
@@ -705,7 +706,7 @@ class ClassTest(unittest.TestCase):
 
       namespace pyInner {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<OutKlass::InnKlass> cpp;
       };
@@ -1058,7 +1059,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -1260,7 +1261,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -1484,7 +1485,7 @@ class ClassTest(unittest.TestCase):
     """, """
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructTy> cpp;
       };
@@ -1656,7 +1657,7 @@ class ClassTest(unittest.TestCase):
     """, r"""
       namespace pyStruct {
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<StructCpp> cpp;
       };
@@ -1822,7 +1823,7 @@ class ClassTest(unittest.TestCase):
         }
       };
 
-      struct wrapper {
+      struct wrapper : ::clif::Allocated {
         PyObject_HEAD
         ::clif::SharedPtr<Overrider> cpp;
       };
@@ -1855,8 +1856,25 @@ class ClassTest(unittest.TestCase):
       // Struct __init__
       static int _ctor(PyObject* self, PyObject* args, PyObject* kw);
 
-      static void _dtor(void* self) {
-        delete reinterpret_cast<wrapper*>(self);
+      static void _dealloc(PyObject* self) {
+        PyObject_GC_UnTrack(self);
+        reinterpret_cast<wrapper*>(self)->~wrapper();
+        Py_TYPE(self)->tp_free(self);
+      }
+
+      static int _traverse(PyObject* self, visitproc visit, void* arg) {
+        auto& cpp = reinterpret_cast<wrapper*>(self)->cpp;
+        if (cpp.unique()) Py_VISIT(cpp->pythis.get());
+        return 0;
+      }
+
+      static int _clear(PyObject* self) {
+        auto& cpp = reinterpret_cast<wrapper*>(self)->cpp;
+        if (cpp.unique()) {
+          PyObject* pythis = cpp->pythis.release();
+          Py_XDECREF(pythis);
+        }
+        return 0;
       }
 
       PyTypeObject wrapper_Type = {
@@ -1864,7 +1882,7 @@ class ClassTest(unittest.TestCase):
         "path.to.ext.module.test.Struct",    // tp_name
         sizeof(wrapper),                     // tp_basicsize
         0,                                   // tp_itemsize
-        Clif_PyType_GenericFree,             // tp_dealloc
+        _dealloc,                            // tp_dealloc
         nullptr,                             // tp_print
         nullptr,                             // tp_getattr
         nullptr,                             // tp_setattr
@@ -1879,10 +1897,10 @@ class ClassTest(unittest.TestCase):
         nullptr,                             // tp_getattro
         nullptr,                             // tp_setattro
         nullptr,                             // tp_as_buffer
-        Py_TPFLAGS_DEFAULT | Py_TPFLAGS_TYPE_SUBCLASS%(f)s | Py_TPFLAGS_BASETYPE, // tp_flags
+        Py_TPFLAGS_DEFAULT | Py_TPFLAGS_TYPE_SUBCLASS%(f)s | Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_GC, // tp_flags
         "CLIF wrapper for StructCpp",        // tp_doc
-        nullptr,                             // tp_traverse
-        nullptr,                             // tp_clear
+        _traverse,                           // tp_traverse
+        _clear,                              // tp_clear
         nullptr,                             // tp_richcompare
         0,                                   // tp_weaklistoffset
         nullptr,                             // tp_iter
@@ -1898,7 +1916,7 @@ class ClassTest(unittest.TestCase):
         _ctor,                               // tp_init
         _allocator,                          // tp_alloc
         PyType_GenericNew,                   // tp_new
-        _dtor,                               // tp_free
+        PyObject_GC_Del,                     // tp_free
         nullptr,                             // tp_is_gc
         nullptr,                             // tp_bases
         nullptr,                             // tp_mro
@@ -1921,8 +1939,11 @@ class ClassTest(unittest.TestCase):
 
       static PyObject* _allocator(PyTypeObject* type, Py_ssize_t nitems) {
         assert(nitems == 0);
-        PyObject* self = reinterpret_cast<PyObject*>(new wrapper);
-        return PyObject_Init(self, &wrapper_Type);
+        void* gcobj = _PyObject_GC_New(&wrapper_Type);
+        if (gcobj == nullptr) return nullptr;
+        PyObject* self = ::clif::ConstructInGcObject<wrapper>(gcobj);
+        PyObject_GC_Track(self);
+        return self;
       }
 
       static StructCpp* ThisPtr(PyObject* py) {
@@ -2079,6 +2100,303 @@ class ClassTest(unittest.TestCase):
       }
     """)
 
+  def testNativeEnum(self):
+    self.m = pyext.Module(PATH, native_enums=True)
+    ast = ast_pb2.EnumDecl()
+    text_format.Parse("""
+      name {
+        native: "MyEnum"
+        cpp_name: "myEnum"
+      }
+      members {
+        native: "ONE"
+        cpp_name: "kOne"
+      }
+    """, ast)
+    out = '\n'.join(self.m.WrapEnum(ast, -1, ''))+'\n'
+    self.assertMultiLineEqual(out, textwrap.dedent("""
+      // Create Python native enum object (cached in _MyEnum) for myEnum
+      static PyObject* wrapmyEnum() {
+        PyObject *py, *py_enum_class{}, *names = PyTuple_New(1);
+        if (names == nullptr) return nullptr;
+        if ((py = Py_BuildValue("(NN)", %(frchar)s("ONE"), PyInt_FromLong(
+              static_cast<typename std::underlying_type<myEnum>::type>(myEnum::kOne)))
+            ) == nullptr) goto err;
+        PyTuple_SET_ITEM(names, 0, py);
+        py_enum_class = ::clif::python::NewEnum("MyEnum", "path.to.ext.module.test", names);
+      err:
+        Py_DECREF(names);
+        return py_enum_class;
+      }
+      static PyObject* _MyEnum{};  // set by above func in Init()
+    """ % self.code))
+    out = '\n'.join(self.m.GenInitFunction('test.h'))
+    self.assertNotIn('PyImport_ImportModule("enum")', out)
+    self.assertIn('(_MyEnum=wrapmyEnum())', out)
+
+  def testFlagsDoNotLeakToNextClass(self):
+    for proto in ("""
+        name { native: "A" cpp_name: "A" }
+        final: true
+        value: true
+        cpp_copyable: true
+        cpp_has_def_ctor: true
+        cpp_has_public_dtor: true
+      """, """
+        name { native: "B" cpp_name: "B" }
+        cpp_has_public_dtor: true
+        members {
+          decltype: FUNC
+          func {
+            name { native: "__init__" cpp_name: "B" }
+            constructor: true
+          }
+        }
+        members {
+          decltype: FUNC
+          func { name { native: "f" cpp_name: "f" } }
+        }
+      """):
+      ast = ast_pb2.ClassDecl()
+      text_format.Parse(proto, ast)
+      out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('->cpp = ::clif::MakeShared<B>(', out)
+    self.assertIn('B* c = ThisPtr(self);', out)
+
+  def testSizeofHook(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      members {
+        decltype: FUNC
+        func {
+          name { native: "SpaceUsed" cpp_name: "SpaceUsed" }
+          returns { type { lang_type: "int" cpp_type: "int" } }
+          sizeof_hook: true
+        }
+      }
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('    PyObject* used = wrapSpaceUsed(self);\n', out)
+    self.assertIn('{C("SpaceUsed"), (PyCFunction)wrapSpaceUsed,', out)
+    self.assertIn('{C("__sizeof__"), (PyCFunction)_sizeof,', out)
+    self.assertNotIn('_instances', out)
+
+  def testNoSizeofByDefault(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertNotIn('__sizeof__', out)
+    self.assertNotIn('_instances', out)
+    self.assertFalse(self.m.instance_counters)
+
+  def testMemoryStatsStruct(self):
+    self.m = pyext.Module(PATH, memory_stats=True)
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('{C("__sizeof__"), (PyCFunction)_sizeof,', out)
+    self.assertIn('  --_instances.live;\n', out)
+    self.assertIn('  ++_instances.live;\n', out)
+    self.assertEqual(self.m.instance_counters, ['pyStruct::_instances'])
+
+  def testWeakrefStruct(self):
+    self.m = pyext.Module(PATH, weakrefs=True)
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('  PyObject* weakrefs = nullptr;\n', out)
+    self.assertIn('    PyObject_ClearWeakRefs(self);\n', out)
+    self.assertIn('  _dealloc,', out)
+    self.assertIn('  offsetof(wrapper, weakrefs),', out)
+
+  def testFreelistStruct(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+      freelist: 16
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('static ::clif::FreeList _freelist("path.to.ext.module.test.Struct", '
+                  'sizeof(wrapper), 16);\n', out)
+    self.assertIn(textwrap.dedent("""\
+      static void _dtor(void* self) {
+        reinterpret_cast<wrapper*>(self)->~wrapper();
+        _freelist.Free(self);
+      }
+      """), out)
+    self.assertIn('  PyObject* self = reinterpret_cast<PyObject*>('
+                  'new(_freelist.Allocate()) wrapper);\n', out)
+
+  def testDeferredDelStruct(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+      deferred_dtor: true
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn(textwrap.dedent("""\
+      static void _dtor(void* self) {
+        ::clif::DeferDelete(reinterpret_cast<wrapper*>(self));
+      }
+      """), out)
+    self.assertIn('  PyObject* self = reinterpret_cast<PyObject*>('
+                  'new wrapper);\n', out)
+    self.assertNotIn('_freelist', out)
+
+  def testValueStructFieldIsCopy(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name { native: "Line" cpp_name: "Line" }
+      final: true
+      value: true
+      cpp_copyable: true
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+      members {
+        decltype: VAR
+        var {
+          name { native: "start" cpp_name: "start" }
+          type {
+            lang_type: "Point"
+            cpp_type: "Point"
+            cpp_toptr_conversion: true
+          }
+        }
+      }
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertNotIn('MakeStdShared', out)
+    self.assertIn('  return Clif_PyObjFrom(reinterpret_cast<wrapper*>(self)'
+                  '->cpp->start, {});\n', out)
+
+  def testWeakrefBaseNeedsWeakrefDerived(self):
+    for weakref in ('weakref: true', ''):
+      ast = ast_pb2.ClassDecl()
+      text_format.Parse("""
+        name { native: "Derived" cpp_name: "Derived" }
+        bases { native: "Base" }
+        cpp_has_def_ctor: true
+        cpp_has_public_dtor: true
+        %s
+      """ % weakref, ast)
+      base = ast_pb2.ClassDecl()
+      text_format.Parse("""
+        name { native: "Base" cpp_name: "Base" }
+        cpp_has_def_ctor: true
+        cpp_has_public_dtor: true
+        weakref: true
+      """, base)
+      self.m = pyext.Module(PATH)
+      list(self.m.WrapClass(base, -1, ''))
+      if weakref:
+        list(self.m.WrapClass(ast, -1, ''))
+        ready = '\n'.join(self.m.GenTypesReady())
+        self.assertIn('  pyDerived::wrapper_Type.tp_base = '
+                      '&pyBase::wrapper_Type;\n'
+                      '  if (!CheckBaseSlots(&pyDerived::wrapper_Type)) '
+                      'return false;\n', ready)
+      else:
+        with self.assertRaises(ValueError):
+          list(self.m.WrapClass(ast, -1, ''))
+
+  def testGcBaseGivesGcDerived(self):
+    base = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name { native: "Base" cpp_name: "Base" }
+      members {
+        decltype: FUNC
+        func {
+          name { native: "__init__" cpp_name: "Base" }
+          constructor: true
+        }
+      }
+      members {
+        decltype: FUNC
+        func { name { native: "F" cpp_name: "f" } virtual: true }
+      }
+    """, base)
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name { native: "Derived" cpp_name: "Derived" }
+      bases { native: "Base" }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+    """, ast)
+    list(self.m.WrapClass(base, -1, ''))
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    self.assertIn('  ::clif::SharedPtr<Derived> cpp;\n', out)
+    self.assertIn('  void* gcobj = _PyObject_GC_New(&wrapper_Type);\n', out)
+    self.assertIn(textwrap.dedent("""\
+      static int _traverse(PyObject* self, visitproc visit, void* arg) {
+        return 0;
+      }
+      """), out)
+    self.assertIn('  Py_TPFLAGS_DEFAULT | Py_TPFLAGS_TYPE_SUBCLASS%s | '
+                  'Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_GC,' % self.code['f'],
+                  out)
+    self.assertIn('  PyObject_GC_Del,', out)
+    ast.freelist = 8
+    with self.assertRaises(ValueError):
+      list(self.m.WrapClass(ast, -1, ''))
+
+  def testIdentityWeakrefStructDealloc(self):
+    ast = ast_pb2.ClassDecl()
+    text_format.Parse("""
+      name {
+        native: "Struct"
+        cpp_name: "Struct"
+      }
+      cpp_has_def_ctor: true
+      cpp_has_public_dtor: true
+      identity: true
+      weakref: true
+    """, ast)
+    out = '\n'.join(self.m.WrapClass(ast, -1, ''))
+    # Weakref callbacks must not find the dying wrapper in the registry.
+    self.assertIn(textwrap.dedent("""\
+      static void _dealloc(PyObject* self) {
+        _registry.Remove(self);
+        if (reinterpret_cast<wrapper*>(self)->weakrefs) {
+          PyObject_ClearWeakRefs(self);
+        }
+      """), out)
+    self.assertEqual(out.count('_registry.Remove('), 1)
+
 
 if __name__ == '__main__':
   unittest.main()
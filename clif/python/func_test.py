@@ -29,7 +29,12 @@ class FuncTest(unittest.TestCase):
         lang_type: "str"
         postconversion: "SomeFunc"
       """, tm)
-    self.m = pyext.Module('my.test', typemap=[tm])
+    blob = ast_pb2.Typemap()
+    text_format.Parse("""
+        lang_type: "blob"
+        postconversion: "Blob"
+      """, blob)
+    self.m = pyext.Module('my.test', typemap=[tm, blob])
 
   def assertFuncEqual(self, proto, code):
     ast = ast_pb2.FuncDecl()
@@ -77,6 +82,262 @@ class FuncTest(unittest.TestCase):
       }
     """)
 
+  def testBlobFunc0(self):
+    # The result is moved to take the Clif_PyObjFrom(std::string&&) overload.
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      returns {
+        type {
+          lang_type: "blob"
+          cpp_type: "::std::string"
+        }
+      }
+    """, """
+      // f() -> blob
+      static PyObject* wrapf(PyObject* self) {
+        // Call actual C++ method.
+        ::std::string ret0 = f();
+        return Clif_PyObjFrom(std::move(ret0), Blob);
+      }
+    """)
+
+  def testBufferFunc0(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      returns {
+        type {
+          lang_type: "buffer<float>"
+          cpp_type: "std::vector<float>"
+          params {
+            lang_type: "float"
+            cpp_type: "float"
+          }
+        }
+      }
+    """, """
+      // f() -> buffer<float>
+      static PyObject* wrapf(PyObject* self) {
+        // Call actual C++ method.
+        std::vector<float> ret0 = f();
+        return ::clif::py::BufferFrom(std::move(ret0));
+      }
+    """)
+
+  def testNdArrayFunc0(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      returns {
+        type {
+          lang_type: "ndarray<list<float>>"
+          cpp_type: "std::vector<std::vector<float>>"
+          params {
+            lang_type: "list<float>"
+            cpp_type: "std::vector<float>"
+            params {
+              lang_type: "float"
+              cpp_type: "float"
+            }
+          }
+        }
+      }
+    """, """
+      // f() -> ndarray<list<float>>
+      static PyObject* wrapf(PyObject* self) {
+        // Call actual C++ method.
+        std::vector<std::vector<float>> ret0 = f();
+        return ::clif::py::NdArrayFrom(std::move(ret0));
+      }
+    """)
+
+  def testReadIntoFunc1(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      params {
+        name {
+          native: "n"
+          cpp_name: "n"
+        }
+        type {
+          lang_type: "int"
+          cpp_type: "int"
+        }
+      }
+      returns {
+        name {
+          native: "data"
+        }
+        type {
+          lang_type: "bytes"
+          cpp_type: "std::string"
+        }
+      }
+      cpp_void_return: true
+      readinto: true
+    """, """
+      // f(n:int) -> bytes
+      static PyObject* wrapf(PyObject* self, PyObject* args, PyObject* kw) {
+        PyObject* a[2];
+        char* names[] = {
+            C("n"),
+            C("data"),
+            nullptr
+        };
+        if (!PyArg_ParseTupleAndKeywords(args, kw, "OO:f", names, &a[0], &a[1])) return nullptr;
+        int arg1;
+        if (!Clif_PyObjAs(a[0], &arg1)) return ArgError("f", names[0], "int", a[0]);
+        if (!::clif::python::IsWritableBuffer(a[1])) return ArgError("f", names[1], "writable buffer", a[1]);
+        std::string ret0{};
+        // Call actual C++ method.
+        f(std::move(arg1), &ret0);
+        return ::clif::py::ReadInto(a[1], ret0);
+      }
+    """)
+
+  def testStrViewFunc1(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      params {
+        name {
+          native: "s"
+          cpp_name: "s"
+        }
+        type {
+          lang_type: "bytes"
+          cpp_type: "::std::string_view"
+        }
+      }
+    """, """
+      // f(s:bytes)
+      static PyObject* wrapf(PyObject* self, PyObject* args, PyObject* kw) {
+        PyObject* a[1];
+        char* names[] = {
+            C("s"),
+            nullptr
+        };
+        if (!PyArg_ParseTupleAndKeywords(args, kw, "O:f", names, &a[0])) return nullptr;
+        ::clif::StrViewArg<::std::string_view> arg1;
+        if (!Clif_PyObjAs(a[0], &arg1)) return ArgError("f", names[0], "::std::string_view", a[0]);
+        // Call actual C++ method.
+        f(arg1.view);
+        Py_RETURN_NONE;
+      }
+    """)
+
+  def testStrViewFunc2opt(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      params {
+        name {
+          native: "s"
+          cpp_name: "s"
+        }
+        type {
+          lang_type: "bytes"
+          cpp_type: "::std::string_view"
+        }
+        default_value: "\\"\\""
+      }
+      params {
+        name {
+          native: "n"
+          cpp_name: "n"
+        }
+        type {
+          lang_type: "int"
+          cpp_type: "int"
+        }
+        default_value: "0"
+      }
+    """, """
+      // f(s:bytes=default, n:int=default)
+      static PyObject* wrapf(PyObject* self, PyObject* args, PyObject* kw) {
+        PyObject* a[2]{};
+        char* names[] = {
+            C("s"),
+            C("n"),
+            nullptr
+        };
+        if (!PyArg_ParseTupleAndKeywords(args, kw, "|OO:f", names, &a[0], &a[1])) return nullptr;
+        int nargs;  // Find how many args actually passed in.
+        for (nargs = 2; nargs > 0; --nargs) {
+          if (a[nargs-1] != nullptr) break;
+        }
+        ::clif::StrViewArg<::std::string_view> arg1;
+        if (nargs > 0) {
+          if (!a[0]) arg1.view = (::std::string_view)"";
+          else if (!Clif_PyObjAs(a[0], &arg1)) return ArgError("f", names[0], "::std::string_view", a[0]);
+        }
+        int arg2;
+        if (nargs > 1) {
+          if (!a[1]) arg2 = (int)0;
+          else if (!Clif_PyObjAs(a[1], &arg2)) return ArgError("f", names[1], "int", a[1]);
+        }
+        // Call actual C++ method.
+        switch (nargs) {
+        case 0:
+          f(); break;
+        case 1:
+          f(arg1.view); break;
+        case 2:
+          f(arg1.view, std::move(arg2)); break;
+        }
+        Py_RETURN_NONE;
+      }
+    """)
+
+  def testBatchedCallbackParamErr(self):
+    for cpp_exact_type in ('Data *', '::std::string &', 'Data &&',
+                           '::std::unique_ptr<Data>'):
+      ast = ast_pb2.FuncDecl()
+      text_format.Parse("""
+        name {
+          native: "f"
+          cpp_name: "f"
+        }
+        params {
+          name {
+            native: "cb"
+            cpp_name: "cb"
+          }
+          type {
+            lang_type: "(d:Data)->None"
+            callable {
+              params {
+                name {
+                  native: "d"
+                }
+                type {
+                  lang_type: "Data"
+                  cpp_type: "Data"
+                }
+                cpp_exact_type: "%s"
+              }
+            }
+          }
+        }
+        batched: true
+      """ % cpp_exact_type, ast)
+      with self.assertRaises(ValueError):
+        list(self.m.WrapFunc(ast, -1, ''))
+
   def testIntFunc0Post(self):
     self.assertFuncEqual("""
       name {
@@ -554,6 +815,51 @@ class FuncTest(unittest.TestCase):
       }
     """)
 
+  def testVoidFunc1cbBatched(self):
+    self.assertFuncEqual("""
+      name {
+        native: "f"
+        cpp_name: "f"
+      }
+      params {
+        name {
+          native: "cb"
+        }
+        type {
+          lang_type: "(i:int)->None"
+          callable {
+            params {
+              name {
+                native: "i"
+                cpp_name: "i"
+              }
+              type {
+                lang_type: "int"
+                cpp_type: "int"
+              }
+              cpp_exact_type: "int"
+            }
+          }
+        }
+      }
+      batched: true
+    """, """
+      // f(cb:(i:int)->None)
+      static PyObject* wrapf(PyObject* self, PyObject* args, PyObject* kw) {
+        PyObject* a[1];
+        char* names[] = {
+            C("cb"),
+            nullptr
+        };
+        if (!PyArg_ParseTupleAndKeywords(args, kw, "O:f", names, &a[0])) return nullptr;
+        std::function<void(int)> arg1;
+        if (!::clif::Clif_PyObjAsBatched(a[0], &arg1)) return ArgError("f", names[0], "", a[0]);
+        // Call actual C++ method.
+        f(std::move(arg1));
+        Py_RETURN_NONE;
+      }
+    """)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -160,6 +160,7 @@ def ReadyFunction(types_init):
         # base is Python wrapper type in a C++ class namespace defined locally.
         # Allow to inherit only from top-level classes.
         yield I+'%s.tp_base = &%s;' % (cppname, base)
+      yield I+'if (!CheckBaseSlots(&%s)) return false;' % cppname
     yield I+'if (PyType_Ready(&%s) < 0) return false;' % cppname
     yield I+'Py_INCREF(&%s);  // For PyModule_AddObject to steal.' % cppname
   yield I+'return true;'
@@ -202,7 +203,9 @@ def InitFunction(pathname, doc, meth_ref, init, dict_):
 
 
 def TypeObject(tp_slots, slotgen, pyname, wname, fqclassname, ctor,
-               abstract, async_dtor=False, subst_cpp_ptr=''):
+               abstract, async_dtor=False, subst_cpp_ptr='', freelist=0,
+               value=False, identity=False, weakref=False, gc=False,
+               deferred_dtor=False, instances=False):
   """Generate PyTypeObject methods and table.
 
   Args:
@@ -215,6 +218,16 @@ def TypeObject(tp_slots, slotgen, pyname, wname, fqclassname, ctor,
     abstract: bool - wrapped C++ class is abstract
     async_dtor: bool - allow Python threads during C++ destructor
     subst_cpp_ptr: str - C++ "replacement" class (being wrapped) if any
+    freelist: int - number of freed instances to keep for reuse
+    value: bool - C++ instance is stored in the wrapper (not SharedPtr)
+    identity: bool - keep _registry of wrappers by C++ instance address
+    weakref: bool - wrapper has weakrefs list (supports weak references)
+    gc: bool - C++ instance (@virtual overrider) refers back to its wrapper,
+      so support the cycle garbage collection (also set for classes derived
+      from such wrapper, without subst_cpp_ptr they have nothing to visit)
+    deferred_dtor: bool - delete the wrapper on the CLIF destructor thread
+    instances: bool - count live instances in _instances (for the module
+      __clif_memory__ report)
 
   Yields:
      Source code for PyTypeObject and tp_alloc / tp_init / tp_free methods.
@@ -225,21 +238,102 @@ def TypeObject(tp_slots, slotgen, pyname, wname, fqclassname, ctor,
   yield '// %s __init__' % pyname
   yield 'static int _ctor(PyObject* self, PyObject* args, PyObject* kw);'
   yield ''
-  yield 'static void _dtor(void* self) {'
+  if instances:
+    # Estimate the C++ instance as owned by the wrapper (value is inside it).
+    size = 'sizeof(%s)' % wname
+    if not value:
+      size += ' + sizeof(%s)' % (subst_cpp_ptr or fqclassname)
+    yield 'static ::clif::InstanceCounter _instances{%s, %s, 0};' % (
+        tp_slots['tp_name'], size)
+    yield ''
+  if freelist:
+    yield ('static ::clif::FreeList _freelist(%s, sizeof(%s), %d);'
+           % (tp_slots['tp_name'], wname, freelist))
+    yield ''
+  if identity:
+    yield 'static ::clif::InstanceRegistry _registry;'
+    yield ''
+  dtor = []
+  if instances and gc:
+    # Python subclass instances are not counted (allocated by the subtype).
+    dtor.append('if (Py_TYPE(self)->tp_alloc == _allocator) '
+                '--_instances.live;')
+  elif instances:
+    dtor.append('--_instances.live;')
+  if identity and not (weakref or gc):
+    dtor.append('_registry.Remove(reinterpret_cast<PyObject*>(self));')
   if async_dtor:
-    yield I+'Py_BEGIN_ALLOW_THREADS'
-  yield I+'delete reinterpret_cast<%s*>(self);' % wname
+    dtor.append('Py_BEGIN_ALLOW_THREADS')
+  if deferred_dtor:
+    dtor.append('::clif::DeferDelete(reinterpret_cast<%s*>(self));' % wname)
+  elif freelist or gc:
+    dtor.append('reinterpret_cast<%s*>(self)->~%s();' % (wname, wname))
+  else:
+    dtor.append('delete reinterpret_cast<%s*>(self);' % wname)
   if async_dtor:
-    yield I+'Py_END_ALLOW_THREADS'
-  yield '}'
-  tp_slots['tp_free'] = '_dtor'
-  tp_slots['tp_dealloc'] = 'Clif_PyType_GenericFree'
+    dtor.append('Py_END_ALLOW_THREADS')
+  if freelist:
+    dtor.append('_freelist.Free(self);')
+  if gc:
+    # Python subclass instances are freed with PyObject_GC_Del (not _dtor), so
+    # destroy C++ wrapper members in tp_dealloc.
+    tp_slots['tp_free'] = 'PyObject_GC_Del'
+    tp_slots['tp_traverse'] = '_traverse'
+    tp_slots['tp_clear'] = '_clear'
+    tp_slots['tp_flags'].append('Py_TPFLAGS_HAVE_GC')
+  else:
+    tp_slots['tp_free'] = '_dtor'
+    yield 'static void _dtor(void* self) {'
+    for s in dtor:
+      yield I+s
+    yield '}'
+  if weakref or gc:
+    if not gc: yield ''  # After _dtor.
+    yield 'static void _dealloc(PyObject* self) {'
+    if identity:
+      # Before weakref callbacks (Python code) can look the instance up.
+      yield I+'_registry.Remove(self);'
+    if gc:
+      yield I+'PyObject_GC_UnTrack(self);'
+    if weakref:
+      yield I+'if (reinterpret_cast<%s*>(self)->weakrefs) {' % wname
+      yield I+I+'PyObject_ClearWeakRefs(self);'
+      yield I+'}'
+    if gc:
+      for s in dtor:
+        yield I+s
+    yield I+'Py_TYPE(self)->tp_free(self);'
+    yield '}'
+    tp_slots['tp_dealloc'] = '_dealloc'
+  else:
+    tp_slots['tp_dealloc'] = 'Clif_PyType_GenericFree'
+  if gc:
+    yield ''
+    yield 'static int _traverse(PyObject* self, visitproc visit, void* arg) {'
+    if subst_cpp_ptr:
+      yield I+'auto& cpp = reinterpret_cast<%s*>(self)->cpp;' % wname
+      # C++ owners (sharing cpp) need pythis alive, so it's not a garbage cycle.
+      yield I+'if (cpp.unique()) Py_VISIT(cpp->pythis.get());'
+    yield I+'return 0;'
+    yield '}'
+    yield ''
+    yield 'static int _clear(PyObject* self) {'
+    if subst_cpp_ptr:
+      yield I+'auto& cpp = reinterpret_cast<%s*>(self)->cpp;' % wname
+      yield I+'if (cpp.unique()) {'
+      yield I+I+'PyObject* pythis = cpp->pythis.release();'
+      yield I+I+'Py_XDECREF(pythis);'
+      yield I+'}'
+    yield I+'return 0;'
+    yield '}'
   tp_slots['tp_alloc'] = '_allocator'
   tp_slots['tp_new'] = 'PyType_GenericNew'
   tp_slots['tp_init'] = '_ctor' if ctor else 'Clif_PyType_Inconstructible'
   tp_slots['tp_basicsize'] = 'sizeof(%s)' % wname
   tp_slots['tp_itemsize'] = tp_slots['tp_version_tag'] = '0'
-  tp_slots['tp_dictoffset'] = tp_slots['tp_weaklistoffset'] = '0'
+  tp_slots['tp_dictoffset'] = '0'
+  tp_slots['tp_weaklistoffset'] = (
+      'offsetof(%s, weakrefs)' % wname if weakref else '0')
   tp_slots['tp_flags'] = ' | '.join(tp_slots['tp_flags'])
   tp_slots['tp_doc'] = '"CLIF wrapper for %s"' % fqclassname
   wtype = '%s_Type' % wname
@@ -265,21 +359,48 @@ def TypeObject(tp_slots, slotgen, pyname, wname, fqclassname, ctor,
       yield I+I+'return -1;'
       yield I+'}'
       cpp = 'reinterpret_cast<%s*>(self)->cpp' % wname
-      yield I+'%s = ::clif::MakeShared<%s>();' % (cpp,
-                                                  subst_cpp_ptr or fqclassname)
+      if value:
+        yield I+'%s.Emplace();' % cpp
+      else:
+        yield I+'%s = ::clif::MakeShared<%s>();' % (cpp,
+                                                    subst_cpp_ptr or fqclassname)
       if subst_cpp_ptr:
         yield I+'%s->::clif::PyObj::Init(self);' % cpp
+      if identity:
+        # Python subclass instances are not freed by _dtor, don't register.
+        yield I+'if (Py_TYPE(self) == &%s) {' % wtype
+        yield I+I+'_registry.Add(%s.get(), self);' % cpp
+        yield I+'}'
       yield I+'return 0;'
     else:  # ctor is WRAP (holds 'wrapper name')
       yield I+'PyObject* init = %s(self, args, kw);' % ctor
       yield I+'Py_XDECREF(init);'
+      if identity:
+        yield I+'if (init && Py_TYPE(self) == &%s) {' % wtype
+        yield I+I+('_registry.Add(reinterpret_cast<%s*>(self)->cpp.get(), '
+                   'self);' % wname)
+        yield I+'}'
       yield I+'return init? 0: -1;'
     yield '}'
   yield ''
   yield 'static PyObject* _allocator(PyTypeObject* type, Py_ssize_t nitems) {'
   yield I+'assert(nitems == 0);'
-  yield I+'PyObject* self = reinterpret_cast<PyObject*>(new %s);' % wname
-  yield I+'return PyObject_Init(self, &%s);' % wtype
+  if freelist:
+    yield I+('PyObject* self = reinterpret_cast<PyObject*>('
+             'new(_freelist.Allocate()) %s);' % wname)
+  elif gc:
+    yield I+'void* gcobj = _PyObject_GC_New(&%s);' % wtype
+    yield I+'if (gcobj == nullptr) return nullptr;'
+    yield I+'PyObject* self = ::clif::ConstructInGcObject<%s>(gcobj);' % wname
+  else:
+    yield I+'PyObject* self = reinterpret_cast<PyObject*>(new %s);' % wname
+  if instances:
+    yield I+'++_instances.live;'
+  if gc:
+    yield I+'PyObject_GC_Track(self);'
+    yield I+'return self;'
+  else:
+    yield I+'return PyObject_Init(self, &%s);' % wtype
   yield '}'
 
 
@@ -334,6 +455,10 @@ def _CreateInputParameter(func_name, ast_param, arg, args):
   if ptype.cpp_abstract:  # for AbstractType &
     args.append('*'+arg)
     return 'std::unique_ptr<%s> %s;' % (ctype, arg)
+  if ctype.endswith('string_view'):
+    # Hold the argument buffer (if any) until the call returns.
+    args.append(arg+'.view')
+    return '::clif::StrViewArg<%s> %s;' % (ctype, arg)
   # Create a copy on stack (even fot T&, most cases should have to_T* conv).
   if ptype.cpp_has_def_ctor:
     args.append('std::move(%s)' % arg)
@@ -343,6 +468,20 @@ def _CreateInputParameter(func_name, ast_param, arg, args):
     return '::gtl::optional<%s> %s;' % (ctype, arg)
 
 
+def _CheckBatchedCallback(func_name, ast_param):
+  """Raise ValueError if callback args can't be copied to a queued call."""
+  for p in ast_param.type.callable.params:
+    ctype = p.cpp_exact_type or p.type.cpp_type
+    if (p.type.cpp_raw_pointer or ctype.endswith('*') or ctype.endswith('&&')
+        or (ctype.endswith('&') and not ctype.startswith('const '))
+        or not p.type.cpp_copyable or 'unique_ptr<' in ctype):
+      raise ValueError('@batched function %s callback %s parameter %s has C++'
+                       ' type %s, queued calls need copyable values (no '
+                       'pointers, non-const or rvalue references or move-only '
+                       'types)' % (func_name, ast_param.name.native,
+                                   p.name.native, ctype))
+
+
 def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
                  typepostconversion, func_ast, lineno, prepend_self=None):
   """Generate PyCFunction wrapper from AST.FuncDecl func_ast.
@@ -372,6 +511,8 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
   nret = len(func_ast.returns)
   params = []  # C++ parameter names.
   nargs = len(func_ast.params)
+  # @readinto takes a buffer (after the C++ args) to copy the last return to.
+  npyargs = nargs + 1 if func_ast.readinto else nargs
   yield ''
   if func_ast.classmethod:
     yield '// @classmethod ' + doc
@@ -380,23 +521,26 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
     yield '// ' + doc
     arg0 = 'self'
   yield 'static PyObject* %s(PyObject* %s%s) {' % (
-      wrapper, arg0, ', PyObject* args, PyObject* kw' if nargs else '')
+      wrapper, arg0, ', PyObject* args, PyObject* kw' if npyargs else '')
   if prepend_self:
     yield I+_CreateInputParameter(pyname+' line %d' % lineno, prepend_self,
                                   'arg0', params)
     yield I+'if (!Clif_PyObjAs(self, &arg0)) return nullptr;'
   minargs = sum(1 for p in func_ast.params if not p.default_value)
-  if nargs:
-    yield I+'PyObject* a[%d]%s;' % (nargs, '' if minargs == nargs else '{}')
+  if npyargs:
+    yield I+'PyObject* a[%d]%s;' % (npyargs, '' if minargs == nargs else '{}')
     yield I+'char* names[] = {'
     for p in func_ast.params:
       yield I+I+I+'C("%s"),' % p.name.native
+    if func_ast.readinto:
+      assert minargs == nargs, '@readinto function with default args'
+      yield I+I+I+'C("%s"),' % (func_ast.returns[-1].name.native or 'buffer')
     yield I+I+I+'nullptr'
     yield I+'};'
     yield I+('if (!PyArg_ParseTupleAndKeywords(args, kw, "%s:%s", names, %s)) '
-             'return nullptr;' % ('O'*nargs if minargs == nargs else
+             'return nullptr;' % ('O'*npyargs if minargs == nargs else
                                   'O'*minargs+'|'+'O'*(nargs-minargs), pyname,
-                                  ', '.join('&a[%d]'%i for i in range(nargs))))
+                                  ', '.join('&a[%d]'%i for i in range(npyargs))))
     if minargs < nargs:
       yield I+'int nargs;  // Find how many args actually passed in.'
       yield I+'for (nargs = %d; nargs > %d; --nargs) {' % (nargs, minargs)
@@ -407,9 +551,16 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
       n = i+1
       arg = 'arg%d' % n
       yield I+_CreateInputParameter(pyname+' line %d' % lineno, p, arg, params)
-      cvt = ('if (!Clif_PyObjAs(a[{i}], &{cvar})) return ArgError'
+      if (func_ast.batched and p.type.HasField('callable')
+          and not p.type.callable.returns):
+        _CheckBatchedCallback(pyname, p)
+        as_func = '::clif::Clif_PyObjAsBatched'
+      else:
+        as_func = 'Clif_PyObjAs'
+      cvt = ('if (!{as_func}(a[{i}], &{cvar})) return ArgError'
              '("{func_name}", names[{i}], "{ctype}", a[{i}]);'
-            ).format(i=i, cvar=arg, func_name=pyname, ctype=astutils.Type(p))
+            ).format(i=i, cvar=arg, func_name=pyname, ctype=astutils.Type(p),
+                     as_func=as_func)
       if i < minargs:
         # Non-default parameter.
         yield I+cvt
@@ -428,13 +579,22 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
           # the matcher would return an integral literal. Using static_cast
           # would be ideal, but its argument should be an expression, which a
           # struct value like {1, 2, 3} is not.
-          yield I+I+'if (!a[%d]) %s = (%s)%s;' % (i, arg, astutils.Type(p),
+          # StrViewArg holds the string_view in .view (and is not assignable).
+          dflt = arg+'.view' if params[-1] == arg+'.view' else arg
+          yield I+I+'if (!a[%d]) %s = (%s)%s;' % (i, dflt, astutils.Type(p),
                                                   p.default_value)
           yield I+I+'else '+cvt
         yield I+'}'
+  if func_ast.readinto:
+    yield I+('if (!::clif::python::IsWritableBuffer(a[{i}])) return ArgError'
+             '("{}", names[{i}], "writable buffer", a[{i}]);'.format(
+                 pyname, i=nargs))
   # Create input parameters for extra return values.
   return_type = astutils.FuncReturnType(func_ast)
   void_return_type = return_type == 'void'
+  if func_ast.readinto and nret == 1 and not void_return_type:
+    raise ValueError('@readinto function %s must return its data in an output '
+                     'parameter' % pyname)
   for n, p in enumerate(func_ast.returns):
     if n or void_return_type:
       yield I+'%s ret%d{};' % (astutils.Type(p), n)
@@ -445,7 +605,7 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
       yield I+s
     call = call[-1]
   if func_ast.async:
-    if nargs:
+    if npyargs:
       yield I+'Py_INCREF(args);'
       yield I+'Py_XINCREF(kw);'
     yield I+'PyThreadState* _save;'
@@ -489,20 +649,23 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
       yield I+'ret0'+postcall_init
   if func_ast.async:
     yield I+'Py_BLOCK_THREADS'
-    if nargs:
+    if npyargs:
       yield I+'Py_DECREF(args);'
       yield I+'Py_XDECREF(kw);'
   if catch:
     for s in _GenExceptionRaise():
       yield s
+  topy = [_ToPython(r.type, 'ret%d' % i, typepostconversion)
+          for i, r in enumerate(func_ast.returns)]
+  if func_ast.readinto:
+    topy[-1] = '::clif::py::ReadInto(a[%d], ret%d)' % (nargs, nret-1)
   # If ctxmgr, force return self on enter, None on exit.
   if nret > 1 or (func_ast.postproc or ctxmgr) and nret:
     yield I+'// Convert return values to Python.'
     yield I+'PyObject* p, * result_tuple = PyTuple_New(%d);' % nret
     yield I+'if (result_tuple == nullptr) return nullptr;'
     for i in range(nret):
-      yield I+'if ((p=Clif_PyObjFrom(std::move(ret%d), %s)) == nullptr) {' % (
-          i, postconv.Initializer(func_ast.returns[i].type, typepostconversion))
+      yield I+'if ((p=%s) == nullptr) {' % topy[i]
       yield I+I+'Py_DECREF(result_tuple);'
       yield I+I+'return nullptr;'
       yield I+'}'
@@ -531,9 +694,9 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
     else:
       yield I+'return result_tuple;'
   elif nret:
-    yield I+'return Clif_PyObjFrom(std::move(ret0%s), %s);' % (
-        ('.value()' if optional_ret0 else ''),
-        postconv.Initializer(func_ast.returns[0].type, typepostconversion))
+    yield I+'return %s;' % (_ToPython(func_ast.returns[0].type, 'ret0.value()',
+                                      typepostconversion)
+                            if optional_ret0 else topy[0])
   elif ctxmgr == '__enter__@':
     yield I+'Py_INCREF(self);'
     yield I+'return self;'
@@ -542,6 +705,16 @@ def FunctionCall(pyname, wrapper, doc, catch, call, postcall_init,
   yield '}'
 
 
+def _ToPython(ast_type, var, typepostconversion):
+  """Return C++ expression to convert (move) C++ var of ast_type to Python."""
+  if ast_type.lang_type.startswith('buffer<'):
+    return '::clif::py::BufferFrom(std::move(%s))' % var
+  if ast_type.lang_type.startswith('ndarray<'):
+    return '::clif::py::NdArrayFrom(std::move(%s))' % var
+  return 'Clif_PyObjFrom(std::move(%s), %s)' % (
+      var, postconv.Initializer(ast_type, typepostconversion))
+
+
 def _GenExceptionTry():
   yield I+'PyObject* err_type = nullptr;'
   yield I+'string err_msg{"C++ exception"};'
@@ -33,6 +33,9 @@
 // on container types with one or more Apply() calls inside like that:
 //   f(T x, pc) { return pc.Apply(x); }  // pc can be {} or Function
 //   f(list<T> x, {F}) { pc.Get(0).Apply(each x) }
+// A PyObjFrom implementation may skip the intermediate Python object and
+// convert directly when it knows F (checked with Is(F)), e.g. std::string with
+// UnicodeFromBytes is decoded straight to unicode.
 
 #include <vector>
 
@@ -54,6 +57,8 @@ class PostConv {
     if (noop_) return x;
         return f_(x);
   }
+  // Is it the postconversion function |f| (to convert directly instead)?
+  bool Is(Func f) const { return !noop_ && f_ == f; }
   const PostConv& Get(Array::size_type i) const {
     if (noop_) return getNoop();
         return c_.at(i);
@@ -12,7 +12,10 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <string>
+
 #include "clif/python/postconv.h"
+#include "clif/python/types.h"
 #include "testing/base/public/gunit.h"
 
 namespace {
@@ -56,6 +59,15 @@ TEST_F(PostConvTest, Int1Ctor) {
   EXPECT_TRUE(_1 == getf(pc));
 }
 
+TEST_F(PostConvTest, Is) {
+  EXPECT_FALSE(PostConv().Is(_1));
+  EXPECT_FALSE(PostConv(_0).Is(_1));
+  EXPECT_TRUE(PostConv(_1).Is(_1));
+  PostConv pc{_1};
+  EXPECT_FALSE(pc.Is(_1));
+  EXPECT_TRUE(pc.Get(0).Is(_1));
+}
+
 TEST_F(PostConvTest, Init1) {
   PostConv pc{_1};
   EXPECT_EQ(1, size(pc));
@@ -90,5 +102,58 @@ TEST_F(PostConvTest, Nested2) {
     }
   }
 }
+
+struct StrPostConvTest : testing::Test {
+  StrPostConvTest() { Py_Initialize(); }
+};
+
+TEST_F(StrPostConvTest, InternedStr) {
+  PostConv istr(InternedStr);
+  PyObject* a = Clif_PyObjFrom(std::string("label"), istr);
+  PyObject* b = Clif_PyObjFrom(std::string("label"), istr);
+  EXPECT_EQ(a, b);
+  // Long strings are not cached.
+  std::string long_label(65, 'x');
+  PyObject* c = Clif_PyObjFrom(long_label, istr);
+  PyObject* d = Clif_PyObjFrom(long_label, istr);
+  EXPECT_NE(c, d);
+  Py_DECREF(c);
+  Py_DECREF(d);
+  // The cache starts over when full.
+  for (int i = 0; i < 8192; ++i) {
+    Py_DECREF(Clif_PyObjFrom("label" + std::to_string(i), istr));
+  }
+  PyObject* e = Clif_PyObjFrom(std::string("label"), istr);
+  EXPECT_NE(a, e);
+  Py_DECREF(a);
+  Py_DECREF(b);
+  // The cache is released at exit.
+  Py_ssize_t refcnt = Py_REFCNT(e);
+  ASSERT_EQ(0, PyRun_SimpleString("import atexit; atexit._run_exitfuncs()"));
+  EXPECT_EQ(refcnt - 1, Py_REFCNT(e));
+  Py_DECREF(e);
+}
+
+TEST_F(StrPostConvTest, Blob) {
+  PostConv blob(Blob);
+  const Py_ssize_t min_size = 1 << 20;  // CLIF_BLOB_VIEW_MIN_SIZE default.
+  PyObject* py = Clif_PyObjFrom(std::string(min_size, 'x'), blob);
+  ASSERT_TRUE(PyMemoryView_Check(py));
+  Py_buffer* view = PyMemoryView_GET_BUFFER(py);
+  EXPECT_TRUE(view->readonly);
+  EXPECT_EQ(min_size, view->len);
+  EXPECT_EQ('x', static_cast<char*>(view->buf)[min_size - 1]);
+  Py_DECREF(py);
+  // Shorter strings are copied.
+  py = Clif_PyObjFrom(std::string(min_size - 1, 'x'), blob);
+  EXPECT_TRUE(PyBytes_CheckExact(py));
+  EXPECT_EQ(min_size - 1, PyBytes_GET_SIZE(py));
+  Py_DECREF(py);
+  // So are strings that can't be moved.
+  const std::string s(min_size, 'x');
+  py = Clif_PyObjFrom(s, blob);
+  EXPECT_TRUE(PyBytes_CheckExact(py));
+  Py_DECREF(py);
+}
 }  // namespace py
 }  // namespace clif
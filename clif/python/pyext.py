@@ -103,12 +103,15 @@ class Context(object):
     self.properties = []  # var/const (pyname, wrapper, 'nullptr', '')
     self.dict = []  # (pyname, nested_pywrapper_cpp_name)
     self.final = False
+    self.value = False  # C++ instance stored in the wrapper (@value class).
+    self.sizeof_hook = None  # Wrapper of @__sizeof__ method.
 
 
 class Module(object):
   """Extended context for module namespace."""
 
-  def __init__(self, full_dotted_modname, typemap=(), for_py3=None, indent=I):
+  def __init__(self, full_dotted_modname, typemap=(), for_py3=None, indent=I,
+               native_enums=False, weakrefs=False, memory_stats=False):
     global I
     if I != indent: I = gen.I = types.I = slots.I = indent
     if for_py3 is None:  # Get the value via our runtime environment.
@@ -127,6 +130,13 @@ class Module(object):
     self.types = set()    # types we wrap here (dups can arise from ie.
                           # wrapping std::function return params)
     self.enums = False    # enums are present
+    self.native_enums = native_enums  # Use runtime enums, not enum module.
+    self.weakrefs = weakrefs  # All classes support weak references.
+    self.weakref_types = set()  # _Type of @weakref classes (local bases).
+    self.gc_types = set()  # _Type of GC (@virtual) classes (local bases).
+    self.deferred_dtors = False  # Have @deferred__del__ classes.
+    self.memory_stats = memory_stats  # Count instances, add __clif_memory__.
+    self.instance_counters = []  # Class _instances for __clif_memory__().
     self.init = []        # Extra init lines
     self.nested = []      # Stack of nested Context's
     self.catch_cpp_exceptions = False
@@ -193,6 +203,10 @@ class Module(object):
       wrapper_name = 'wrap' + types.Mangle(cname)
       if pyname != cname:
         wrapper_name += '_as_' + pyname
+    if f.sizeof_hook:
+      if not self.nested:
+        raise ValueError('@__sizeof__ function %s must be a method' % pyname)
+      self.nested[-1].sizeof_hook = wrapper_name
     if f.ignore_return_value:
       assert len(f.returns) < 2, ('Func with ignore_return_value has too many'
                                   ' returns (%d)' % len(f.returns))
@@ -221,7 +235,10 @@ class Module(object):
         else:
           ctor = self.fqname
         if pyname == '__init__':
-          call = '%s = ::clif::MakeShared<%s>' % (cpp, ctor)
+          if self.value:
+            call = cpp + '.Emplace'
+          else:
+            call = '%s = ::clif::MakeShared<%s>' % (cpp, ctor)
           if postcall:
             postcall = cpp + postcall
           # C++ constructors do not return anything.
@@ -353,8 +370,10 @@ class Module(object):
     if base:
       yield I+base+'return nullptr;'
     # Try to return a nested container (we use cpp_toptr_conversion as
-    # an indicator for a custom container).
-    if not is_property and not cfunc_getset and v.type.cpp_toptr_conversion:
+    # an indicator for a custom container). A @value instance is not in a
+    # SharedPtr to share, so return a copy.
+    if (not is_property and not cfunc_getset and v.type.cpp_toptr_conversion
+        and not self.value):
       yield I+'auto var_sp = ::clif::MakeStdShared(%s, &%s);' % (cpp, cvar)
       c = 'var_sp'
     else:
@@ -427,14 +446,37 @@ class Module(object):
       yield '};'
       b = c.bases.add()
       b.cpp_name = c.name.cpp_name
+    # A wrapper derived from a GC wrapper needs own GC slots too (PyType_Ready
+    # would copy the base ones working with the base overrider layout).
+    gc = virtual or any(
+        _ClassNamespace(b.native) + '::%s_Type' % self.wrapper_class_name
+        in self.gc_types for b in c.bases if b.native and not b.cpp_name)
+    if gc and c.freelist:
+      raise ValueError("@freelist class %s can't have virtual methods"
+                       ' (or a base with them).' % pyname)
+    if c.deferred_dtor:
+      if gc or c.freelist:
+        raise ValueError("@deferred__del__ class %s can't have virtual methods"
+                         ' (or a base with them) or be @freelist.' % pyname)
+      self.deferred_dtors = True
+    if c.value and not (c.cpp_copyable and c.cpp_has_public_dtor):
+      raise ValueError('@value class %s must be copyable and destructible'
+                       % pyname)
     yield ''
-    yield 'struct %s {' % self.wrapper_class_name
+    weakref = c.weakref or self.weakrefs
+    yield 'struct %s : ::clif::Allocated {' % self.wrapper_class_name
     yield I+'PyObject_HEAD'
-    yield I+'::clif::SharedPtr<%s> cpp;' % (VIRTUAL_OVERRIDER_CLASS if virtual
-                                            else c.name.cpp_name)
+    if weakref:
+      yield I+'PyObject* weakrefs = nullptr;'
+    if c.value:
+      self.nested[-1].value = True
+      yield I+'::clif::InlineValue<%s> cpp;' % c.name.cpp_name
+    else:
+      yield I+'::clif::SharedPtr<%s> cpp;' % (VIRTUAL_OVERRIDER_CLASS if virtual
+                                              else c.name.cpp_name)
     yield '};'
     if c.final:
-      self.final = True
+      self.nested[-1].final = True
     else:
       yield 'static %s* ThisPtr(PyObject*);' % c.name.cpp_name
     ctor = ('DEF' if c.cpp_has_def_ctor and (not c.cpp_abstract or virtual)
@@ -490,11 +532,15 @@ class Module(object):
       for s in (
           slots.GenSlots(self.methods, tp_slots, py3=self.py3output)
           ): yield s
-      if self.methods:  # If all methods are slots, it's empty.
-        for s in (
-            gen.MethodDef(self.methods)
-            ): yield s
-        tp_slots['tp_methods'] = gen.MethodDef.name
+    if self.sizeof_hook or self.memory_stats:
+      for s in (
+          self._WrapSizeof(c.value)  # Not a slot, can't be in GenSlots.
+          ): yield s
+    if self.methods:  # If all methods are slots, it's empty.
+      for s in (
+          gen.MethodDef(self.methods)
+          ): yield s
+      tp_slots['tp_methods'] = gen.MethodDef.name
     pypath = '.'.join(f.pyname for f in self.nested)
     tp_slots['tp_name'] = '"%s.%s"' % (self.path, pypath)
     for s in (
@@ -505,6 +551,10 @@ class Module(object):
                        abstract=c.cpp_abstract,
                        subst_cpp_ptr=VIRTUAL_OVERRIDER_CLASS if virtual else '',
                        async_dtor=c.async_dtor,
+                       freelist=c.freelist, value=c.value,
+                       identity=c.identity, weakref=weakref, gc=gc,
+                       deferred_dtor=c.deferred_dtor,
+                       instances=self.memory_stats,
                       )
         ): yield s
     for s in types.GenThisPointerFunc(c.name.cpp_name, self.wrapper_class_name,
@@ -514,6 +564,8 @@ class Module(object):
     type_dict = self.dict
     wrapns = '::'.join(f.class_namespace for f in self.nested) + '::'
     wclass = wrapns + self.wrapper_class_name
+    if self.memory_stats:
+      self.instance_counters.append(wrapns + '_instances')
     vclass = wrapns + VIRTUAL_OVERRIDER_CLASS
     wrap = '::' + self.wrapper_class_name
     wtype = wclass + '_Type'
@@ -530,10 +582,18 @@ class Module(object):
         base = base[0]
         if '.' not in base:
           # base defined in the same .clif wrapper
+          pybase = base
           base = _ClassNamespace(base) + wrapt
+          if base in self.weakref_types and not weakref:
+            raise ValueError('Class %s must be @weakref as its base %s'
+                             % (pyname, pybase))
       elif c.bases[0].native == 'replacement':
         assert c.bases[0].cpp_name
         cpp_replacement = c.bases[0].cpp_name
+    if weakref:
+      self.weakref_types.add(wtype)
+    if gc:
+      self.gc_types.add(wtype)
     self.types_init.append((wtype, base, type_dict))
     self.dict.append((pyname, types.AsPyObj(self.wrap_namespace+'::'+wtype)))
     if cpp_replacement:
@@ -550,7 +610,45 @@ class Module(object):
                         can_destruct=c.cpp_has_public_dtor,
                         down_cast=cpp_replacement,
                         virtual=vclass if virtual else '',
-                        ns=cpp_namespace))
+                        ns=cpp_namespace, value=c.value,
+                        identity=c.identity))
+
+  def _WrapSizeof(self, value):
+    """Generate __sizeof__ method to count the C++ instance the wrapper owns.
+
+    A @__sizeof__ method (like SpaceUsed) is used as a size hook to get the C++
+    instance size (instead of sizeof).
+
+    Args:
+      value: bool - C++ instance stored in the wrapper (@value class)
+
+    Yields:
+      Source code for _sizeof function (if needed).
+    """
+    hook = self.sizeof_hook
+    if value and not hook:
+      return  # Default object.__sizeof__ is just right.
+    yield ''
+    yield 'static PyObject* _sizeof(PyObject* self) {'
+    yield I+'Py_ssize_t size = Py_TYPE(self)->tp_basicsize;'
+    yield I+'auto& cpp = reinterpret_cast<%s*>(self)->cpp;' % (
+        self.wrapper_class_name)
+    yield I+'if (%s) {' % ('cpp' if value else 'cpp.unique()')
+    if hook:
+      yield I+I+'PyObject* used = %s(self);' % hook
+      yield I+I+'if (used == nullptr) return nullptr;'
+      yield I+I+('Py_ssize_t n = PyNumber_AsSsize_t(used, '
+                 'PyExc_OverflowError);')
+      yield I+I+'Py_DECREF(used);'
+      yield I+I+'if (n == -1 && PyErr_Occurred()) return nullptr;'
+      yield I+I+'size += n%s;' % (' - sizeof(*cpp)' if value else '')
+    else:
+      yield I+I+'size += sizeof(*cpp);'
+    yield I+'}'
+    yield I+'return PyInt_FromSsize_t(size);'
+    yield '}'
+    self.methods.append(('__sizeof__', '_sizeof', NOARGS,
+                         '__sizeof__() -> int\\n  Size in memory, in bytes'))
 
   def WrapEnum(self, e, unused_ln, cpp_namespace):
     """Process AST.EnumDecl e."""
@@ -568,11 +666,11 @@ class Module(object):
     genw = 'wrap'+Ident(e.name.cpp_name)
     pyname = '.'.join([f.pyname for f in self.nested] + [e.name.native])
     t = types.EnumType(e.name.cpp_name, pyname, pytype, self.CppName(wclass),
-                       cpp_namespace)
+                       cpp_namespace, native=self.native_enums)
     self.types.add(t)
     self.dict.append((e.name.native,
                       '(%s=%s())' % (self.CppName(wclass), self.CppName(genw))))
-    if not self.enums:
+    if not (self.enums or self.native_enums):
       self.enums = True
       self.init.extend([
           '{PyObject* em = PyImport_ImportModule("enum");',
@@ -587,7 +685,8 @@ class Module(object):
           '}'])
     yield ''
     for s in (
-        t.CreateEnum(self.wrap_namespace, genw, wclass, items, self.py3output)
+        t.CreateEnum(self.wrap_namespace, genw, wclass, items, self.py3output,
+                     self.path)
         ): yield s
 
   def WrapCapsule(self, p, unused_ln, ns):
@@ -633,7 +732,7 @@ class Module(object):
     for s in (
         postconv.GenPostConvTable(self.typemap)
         ): yield s
-    if astutils.HaveEnum(ast.decls):
+    if astutils.HaveEnum(ast.decls) and not self.native_enums:
       yield ''
       yield 'static PyObject *_Enum{}, *_IntEnum{};  // set below in Init()'
     self.catch_cpp_exceptions = ast.catch_exceptions
@@ -646,6 +745,25 @@ class Module(object):
     yield ''
     yield ''
     yield '// Initialize module'
+    if self.instance_counters:
+      yield ''
+      yield 'static PyObject* _clif_memory(PyObject* module) {'
+      yield I+'static const ::clif::InstanceCounter* counters[] = {'
+      for c in self.instance_counters:
+        yield I+I+'&%s,' % c
+      yield I+'};'
+      yield I+('return ::clif::python::MemoryReport(counters, %d);'
+               % len(self.instance_counters))
+      yield '}'
+      self.methods.append(('__clif_memory__', '_clif_memory', NOARGS,
+                           'Live instances and their estimated bytes by'
+                           ' wrapped class'))
+    if self.deferred_dtors:
+      self.methods.extend([
+          ('__flush_deferred_del__', '::clif::python::FlushDeferredDel',
+           NOARGS, 'Wait for all @deferred__del__ C++ destructors to finish'),
+          ('__deferred_del_stats__', '::clif::python::DeferredDelStats',
+           NOARGS, 'Deferred destructors queue depth, max_depth and done')])
     if self.methods:
       for s in (
           gen.MethodDef(self.methods)
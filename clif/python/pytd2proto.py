@@ -324,10 +324,38 @@ class Postprocessor(object):
     if 'final' in decorators:
       p.final = True
       decorators.remove('final')
+    if 'value' in decorators:
+      if not p.final:
+        raise ValueError('@value class %s must be @final%s' % (pyname, atln))
+      p.value = True
+      decorators.remove('value')
+    if 'identity' in decorators:
+      if p.value:
+        raise ValueError('@value class %s can\'t be @identity%s'
+                         % (pyname, atln))
+      p.identity = True
+      decorators.remove('identity')
+    if 'weakref' in decorators:
+      p.weakref = True
+      decorators.remove('weakref')
     if 'async__del__' in decorators:
       p.async_dtor = True
       decorators.remove('async__del__')
       self.need_threads = True
+    if 'deferred__del__' in decorators:
+      if p.async_dtor:
+        raise ValueError('Class %s can be either @async__del__ or '
+                         '@deferred__del__%s' % (pyname, atln))
+      p.deferred_dtor = True
+      decorators.remove('deferred__del__')
+    for d in decorators:
+      m = re.match(r'freelist\((\d+)\)$', d)
+      if m:
+        p.freelist = int(m.group(1))
+        if not p.freelist:
+          raise ValueError('@freelist size must be positive' + atln)
+        decorators.remove(d)
+        break
     if decorators:
       raise NameError('Unknown class decorator(s)%s: %s'
                       % (atln, ', '.join(decorators)))
@@ -528,6 +556,27 @@ class Postprocessor(object):
     if 'async' in decorators:
       f.async = True
       self.need_threads = True
+    if 'batched' in decorators:
+      if not any(p.type.HasField('callable') and not p.type.callable.returns
+                 for p in f.params):
+        raise ValueError('@batched function %s needs a callback parameter '
+                         'returning None' % f.name.native)
+      f.batched = True
+    if '__sizeof__' in decorators:
+      if (ast.self != 'self' or f.params or len(f.returns) != 1
+          or f.returns[0].type.lang_type != 'int'):
+        raise ValueError('@__sizeof__ method %s must take only self and '
+                         'return int' % f.name.native)
+      f.sizeof_hook = True
+    if 'readinto' in decorators:
+      if not f.returns or f.returns[-1].type.lang_type not in (
+          'bytes', 'list<int>', 'list<float>'):
+        raise ValueError('@readinto function %s must return bytes, '
+                         'list<int> or list<float> last' % f.name.native)
+      if any(p.default_value for p in f.params):
+        raise ValueError('@readinto function %s can\'t have default '
+                         'arguments' % f.name.native)
+      f.readinto = True
     if 'add__init__' in decorators:
       f.name.cpp_name = ''  # A hack to flag an extra ctor.
     if 'sequential' in decorators:
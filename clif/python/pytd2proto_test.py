@@ -118,6 +118,72 @@ class ToprotoTest(unittest.TestCase):
         extra_init: "PyEval_InitThreads();"
       """)
 
+  def testFromDefBuffer(self):
+    self.ClifEqualWithTypes("""\
+        type buffer = list
+        from "some.h":
+          def f() -> buffer<float>
+      """, """\
+        source: "clif_python_pytd2proto_test"
+        usertype_includes: "clif/python/types.h"
+        decls {
+          decltype: FUNC
+          cpp_file: "some.h"
+          line_number: 3
+          func {
+            name {
+              native: "f"
+              cpp_name: "f"
+            }
+            returns {
+              type {
+                lang_type: "buffer<float>"
+                cpp_type: "std::vector"
+                params {
+                  lang_type: "float"
+                  cpp_type: "double"
+                }
+              }
+            }
+          }
+        }
+      """)
+
+  def testFromDefNdArray(self):
+    self.ClifEqualWithTypes("""\
+        type ndarray = list
+        from "some.h":
+          def f() -> ndarray<list<float>>
+      """, """\
+        source: "clif_python_pytd2proto_test"
+        usertype_includes: "clif/python/types.h"
+        decls {
+          decltype: FUNC
+          cpp_file: "some.h"
+          line_number: 3
+          func {
+            name {
+              native: "f"
+              cpp_name: "f"
+            }
+            returns {
+              type {
+                lang_type: "ndarray<list<float>>"
+                cpp_type: "std::vector"
+                params {
+                  lang_type: "list<float>"
+                  cpp_type: "std::vector"
+                  params {
+                    lang_type: "float"
+                    cpp_type: "double"
+                  }
+                }
+              }
+            }
+          }
+        }
+      """)
+
   def testFromDefCallable(self):
     self.ClifEqualWithTypes("""\
         type str = bytes
@@ -193,6 +259,102 @@ class ToprotoTest(unittest.TestCase):
         extra_init: "PyEval_InitThreads();"
       """)
 
+  def testFromDefBatchedCallable(self):
+    self.ClifEqual("""\
+        from "some.h":
+          @batched
+          def f(cb: ()->None)
+      """, """\
+        source: "clif_python_pytd2proto_test"
+        decls {
+          decltype: FUNC
+          cpp_file: "some.h"
+          line_number: 2
+          func {
+            name {
+              native: "f"
+              cpp_name: "f"
+            }
+            params {
+              name {
+                native: "cb"
+                cpp_name: "cb"
+              }
+              type {
+                lang_type: "()->None"
+                callable {
+                  cpp_opfunction: true
+                }
+              }
+            }
+            batched: true
+          }
+        }
+        extra_init: "PyEval_InitThreads();"
+      """)
+
+  def testFromDefBatchedErrNoCallback(self):
+    with self.assertRaises(ValueError):
+      self.ClifEqualWithTypes("""\
+        from "some.h":
+          @batched
+          def f(cb: ()->int)
+        """, '')
+
+  def testFromDefReadInto(self):
+    self.ClifEqualWithTypes("""\
+        from "some.h":
+          @readinto
+          def f(n: int) -> bytes
+      """, """\
+        source: "clif_python_pytd2proto_test"
+        usertype_includes: "clif/python/types.h"
+        decls {
+          decltype: FUNC
+          cpp_file: "some.h"
+          line_number: 2
+          func {
+            name {
+              native: "f"
+              cpp_name: "f"
+            }
+            params {
+              name {
+                native: "n"
+                cpp_name: "n"
+              }
+              type {
+                lang_type: "int"
+                cpp_type: "int"
+              }
+            }
+            returns {
+              type {
+                lang_type: "bytes"
+                cpp_type: "string"
+              }
+            }
+            readinto: true
+          }
+        }
+      """)
+
+  def testFromDefReadIntoErrType(self):
+    with self.assertRaises(ValueError):
+      self.ClifEqualWithTypes("""\
+        from "some.h":
+          @readinto
+          def f() -> int
+        """, '')
+
+  def testFromDefReadIntoErrDefault(self):
+    with self.assertRaises(ValueError):
+      self.ClifEqualWithTypes("""\
+        from "some.h":
+          @readinto
+          def f(n: int = default) -> bytes
+        """, '')
+
   def testOptional(self):
     self.ClifEqualWithTypes("""\
         type str = bytes
@@ -911,6 +1073,70 @@ class ToprotoTest(unittest.TestCase):
         extra_init: "PyEval_InitThreads();"
       """)
 
+  def testFromClassDecorators(self):
+    for decorators, fields in [
+        (['@freelist(16)'], ['freelist: 16']),
+        (['@identity'], ['identity: true']),
+        (['@weakref'], ['weakref: true']),
+        (['@deferred__del__'], ['deferred_dtor: true']),
+        (['@final', '@value'], ['final: true', 'value: true']),
+    ]:
+      pytd_parser.reset_indentation()
+      self.ClifEqual("""\
+        from "foo.h":
+          %s
+          class Foo:
+            def f(self)
+        """ % '\n          '.join(decorators), """\
+          source: "clif_python_pytd2proto_test"
+          decls {
+            decltype: CLASS
+            cpp_file: "foo.h"
+            line_number: 2
+            class_ {
+              name {
+                native: "Foo"
+                cpp_name: "Foo"
+              }
+              members {
+                decltype: FUNC
+                line_number: %d
+                func {
+                  name {
+                    native: "f"
+                    cpp_name: "f"
+                  }
+                }
+              }
+              %s
+            }
+          }
+        """ % (3 + len(decorators), '\n              '.join(fields)))
+
+  def testFromClassDecoratorsErr(self):
+    for decorators in [
+        ['@async__del__', '@deferred__del__'],
+        ['@value'],  # Not @final.
+        ['@final', '@value', '@identity'],
+    ]:
+      pytd_parser.reset_indentation()
+      with self.assertRaises(ValueError):
+        self.ClifEqual("""\
+          from "foo.h":
+            %s
+            class Foo:
+              def f(self)
+          """ % '\n            '.join(decorators), '')
+
+  def testFromClassSizeofHookErr(self):
+    with self.assertRaises(ValueError):
+      self.ClifEqualWithTypes("""\
+        from "foo.h":
+          class Foo:
+            @__sizeof__
+            def SpaceUsed(self, deep: int) -> int
+        """, '')
+
   def testFromClassBadInitName(self):
     # TODO: Add check for warning about Init->Foo renaming.
     self.ClifEqualWithTypes("""\
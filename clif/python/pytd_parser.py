@@ -67,7 +67,10 @@ pdef = Group(Group(NAME)('name') + S(':') - type +
              Optional(S('=') + K('default')))
 plist = pp.ZeroOrMore(S(',') + pdef)
 
-decorators = Group(pp.ZeroOrMore(S('@') - NAME + NEWLINE))('decorators')
+# Decorator may have an int argument, like @freelist(10), kept as one string.
+decorator = pp.Combine(NAME + Optional(pp.Literal('(') + pp.Word(pp.nums) +
+                                       pp.Literal(')')))
+decorators = Group(pp.ZeroOrMore(S('@') - decorator + NEWLINE))('decorators')
 parameters = Group(PARENS(Optional(pdef + plist)))('params')
 mparameters = PARENS((W('self') | W('cls'))('self') + Group(plist)('params'))
 postproc = Optional(BLOCK(
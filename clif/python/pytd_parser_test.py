@@ -193,6 +193,10 @@ class PytdParserTest(unittest.TestCase):
     self.EQ(classdef, '@final\nclass Abc:\n  @classmethod\n  def f(cls)',
             ['class', 0, ['final'], ['Abc'], [],
              [['func', 20, ['classmethod'], ['f'], 'cls', []]]])
+    reset_indentation()
+    self.EQ(classdef, '@freelist(8)\nclass Abc:\n  def f(self)',
+            ['class', 0, ['freelist(8)'], ['Abc'], [],
+             [['func', 26, [], ['f'], 'self', []]]])
 
   def testCapsule0(self):
     self.EQ(capsule_def, 'capsule Abc', ['capsule', 0, ['Abc']])
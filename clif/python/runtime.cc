@@ -13,6 +13,15 @@
 // limitations under the License.
 
 #include "clif/python/runtime.h"
+#include <pthread.h>
+#include <cstdlib>
+#include <cstring>
+#include <condition_variable>  // NOLINT(build/c++11)
+#include <deque>
+#include <mutex>  // NOLINT(build/c++11)
+#include <new>
+#include <thread>  // NOLINT(build/c++11)
+#include <vector>
 
 extern "C" {
 void Clif_PyType_GenericFree(PyObject* self) {
@@ -65,6 +74,23 @@ PyObject* ImportFQName(const string& full_class_name) {
   return py;
 }
 
+bool CheckBaseSlots(PyTypeObject* type) {
+  PyTypeObject* base = type->tp_base;
+  if (base->tp_weaklistoffset && !type->tp_weaklistoffset) {
+    PyErr_Format(PyExc_TypeError, "%s must be @weakref as its base %s",
+                 type->tp_name, base->tp_name);
+    return false;
+  }
+  if (PyType_HasFeature(base, Py_TPFLAGS_HAVE_GC) &&
+      !PyType_HasFeature(type, Py_TPFLAGS_HAVE_GC)) {
+    PyErr_Format(PyExc_TypeError,
+                 "%s must have @virtual methods as its base %s",
+                 type->tp_name, base->tp_name);
+    return false;
+  }
+  return true;
+}
+
 // py.__class__.__name__
 const char* ClassName(PyObject* py) {
   /* PyPy doesn't have a separate C API for old-style classes. */
@@ -93,10 +119,91 @@ const char* ClassType(PyObject* py) {
   return "instance";
 }
 
+namespace {
+
+// Return a borrowed reference to the Python function that implements
+// |callable| or nullptr if it is not a (bound) Python function or an object
+// with a Python __call__ method. |bound| set to the number of implicit args.
+PyObject* PythonFunction(PyObject* callable, int* bound) {
+  *bound = 0;
+  if (!PyFunction_Check(callable) && !PyMethod_Check(callable) &&
+      !PyType_Check(callable)
+#if PY_MAJOR_VERSION < 3
+      && !PyInstance_Check(callable)
+#endif
+      ) {
+    // Callable object: get type(callable).__call__ via the type method cache.
+    static PyObject* call = nullptr;
+    if (call == nullptr) {
+#if PY_MAJOR_VERSION < 3
+      call = PyString_InternFromString("__call__");
+#else
+      call = PyUnicode_InternFromString("__call__");
+#endif
+      if (call == nullptr) {
+        PyErr_Clear();
+        return nullptr;
+      }
+    }
+    PyObject* f = _PyType_Lookup(Py_TYPE(callable), call);
+    if (f == nullptr || !PyFunction_Check(f)) return nullptr;
+    *bound = 1;
+    return f;
+  }
+  if (PyMethod_Check(callable)) {
+    if (PyMethod_GET_SELF(callable) == nullptr) return nullptr;  // Unbound.
+    *bound = 1;
+    callable = PyMethod_GET_FUNCTION(callable);
+  }
+  return PyFunction_Check(callable) ? callable : nullptr;
+}
+
+// Check Python function code object accepts |nargs| positional arguments.
+bool FunctionNeedsNarguments(PyObject* func, int nargs) {
+  auto code = reinterpret_cast<PyCodeObject*>(PyFunction_GET_CODE(func));
+  PyObject* defaults = PyFunction_GET_DEFAULTS(func);
+  int max = code->co_argcount;
+  int min = max - (defaults ? PyTuple_GET_SIZE(defaults) : 0);
+#if PY_MAJOR_VERSION >= 3
+  PyObject* kwdefaults = PyFunction_GET_KW_DEFAULTS(func);
+  if (code->co_kwonlyargcount > (kwdefaults ? PyDict_Size(kwdefaults) : 0)) {
+    PyErr_SetString(PyExc_TypeError,
+                    "callable requires keyword-only arguments");
+    return false;
+  }
+#endif
+  if (nargs >= min && (nargs <= max || code->co_flags & CO_VARARGS)) {
+    return true;
+  }
+  if (code->co_flags & CO_VARARGS) {
+    PyErr_Format(PyExc_TypeError,
+                 "callable takes at least %d arguments (%d given)", min, nargs);
+  } else if (min == max) {
+    PyErr_Format(PyExc_TypeError,
+                 "callable takes exactly %d arguments (%d given)", max, nargs);
+  } else {
+    PyErr_Format(PyExc_TypeError,
+                 "callable takes from %d to %d arguments (%d given)",
+                 min, max, nargs);
+  }
+  return false;
+}
+}  // namespace
+
 bool CallableNeedsNarguments(PyObject* callable, int nargs) {
-  PyObject* getcallargs = ImportFQName("inspect.getcallargs");
-  if (!getcallargs) return false;
+  int bound;
+  PyObject* func = PythonFunction(callable, &bound);
+  if (func != nullptr) return FunctionNeedsNarguments(func, nargs + bound);
+  // C functions do not declare their arguments, calling them checks those.
+  if (PyCFunction_Check(callable)) return true;
+  // Not a Python function: let inspect bind the arguments.
+  static PyObject* getcallargs = nullptr;
+  if (getcallargs == nullptr) {
+    getcallargs = ImportFQName("inspect.getcallargs");
+    if (!getcallargs) return false;
+  }
   PyObject* args = PyTuple_New(nargs+1);
+  if (!args) return false;
   Py_INCREF(callable);
   PyTuple_SET_ITEM(args, 0, callable);
   for (int i=1; i <= nargs; ++i) {
@@ -104,13 +211,247 @@ bool CallableNeedsNarguments(PyObject* callable, int nargs) {
     PyTuple_SET_ITEM(args, i, Py_None);
   }
   PyObject* binded = PyObject_CallObject(getcallargs, args);
-  Py_DECREF(getcallargs);
   Py_DECREF(args);
   if (!binded) return false;  // PyExc_TypeError is set.
   Py_DECREF(binded);
   return true;
 }
 
+namespace {
+
+// Queued callbacks, never destroyed to be safe to use at exit.
+std::mutex* callbacks_mu = new std::mutex;
+std::vector<std::function<void()>>* callbacks =
+    new std::vector<std::function<void()>>;
+bool callbacks_scheduled = false;  // Pending call added, guarded by mu.
+
+int RunQueuedCallbacks(void*) {
+  FlushCallbacks();
+  return 0;
+}
+}  // namespace
+
+void QueueCallback(std::function<void()> call) {
+  bool schedule;
+  {
+    std::lock_guard<std::mutex> lock(*callbacks_mu);
+    callbacks->push_back(std::move(call));
+    schedule = !callbacks_scheduled;
+    callbacks_scheduled = true;
+  }
+  // Only the first call to an empty queue schedules a batch run.
+  if (schedule && Py_AddPendingCall(RunQueuedCallbacks, nullptr) < 0) {
+    // Python pending calls queue is full, retry on the next call.
+    std::lock_guard<std::mutex> lock(*callbacks_mu);
+    callbacks_scheduled = false;
+  }
+}
+
+void FlushCallbacks() {
+  std::vector<std::function<void()>> batch;
+  {
+    std::lock_guard<std::mutex> lock(*callbacks_mu);
+    batch.swap(*callbacks);
+    callbacks_scheduled = false;
+  }
+  for (auto& call : batch) call();
+}
+
+namespace {
+
+// Deferred destructors queue served by a background thread started on first
+// use. Never destroyed to be safe to use at exit.
+struct DeferredDestructors {
+  std::mutex mu;
+  std::condition_variable queued;  // Signaled when queue is not empty.
+  std::condition_variable done;    // Signaled when stats.depth drops to 0.
+  std::deque<std::function<void()>> queue;
+  DeferredDestructionStats stats{};
+  bool started = false;
+};
+DeferredDestructors* deferred = new DeferredDestructors;
+bool deferred_handlers = false;  // Py_AtExit and fork handlers registered.
+
+void RunDeferredDestructors() {
+  std::unique_lock<std::mutex> lock(deferred->mu);
+  for (;;) {
+    deferred->queued.wait(lock, [] { return !deferred->queue.empty(); });
+    std::function<void()> dtor = std::move(deferred->queue.front());
+    deferred->queue.pop_front();
+    lock.unlock();
+    dtor();
+    dtor = nullptr;  // Destroy captured state without the lock too.
+    lock.lock();
+    ++deferred->stats.done;
+    if (--deferred->stats.depth == 0) deferred->done.notify_all();
+  }
+}
+
+// Must be called with deferred->mu held.
+void StartDeferredDestructors() {
+  if (deferred->started) return;
+  deferred->started = true;
+  std::thread(RunDeferredDestructors).detach();
+}
+
+// Fork handlers: the lock is held over fork() so the child gets a consistent
+// state. The child has no destructor thread, so it gets a new state (its lock
+// stays locked) with the queued destructors, started again on demand.
+void LockDeferredForFork() { deferred->mu.lock(); }
+void UnlockDeferredForFork() { deferred->mu.unlock(); }
+void ResetDeferredInChild() {
+  DeferredDestructors* parent = deferred;
+  deferred = new DeferredDestructors;
+  deferred->queue.swap(parent->queue);
+  deferred->stats = parent->stats;
+  // A destructor running in the parent at fork() is not run here.
+  deferred->stats.depth = deferred->queue.size();
+}
+}  // namespace
+
+void DeferDestruction(std::function<void()> dtor) {
+  std::lock_guard<std::mutex> lock(deferred->mu);
+  if (!deferred_handlers) {
+    deferred_handlers = true;
+    Py_AtExit(FlushDeferredDestruction);
+    pthread_atfork(LockDeferredForFork, UnlockDeferredForFork,
+                   ResetDeferredInChild);
+  }
+  StartDeferredDestructors();
+  deferred->queue.push_back(std::move(dtor));
+  if (++deferred->stats.depth > deferred->stats.max_depth) {
+    deferred->stats.max_depth = deferred->stats.depth;
+  }
+  deferred->queued.notify_one();
+}
+
+void FlushDeferredDestruction() {
+  std::unique_lock<std::mutex> lock(deferred->mu);
+  if (!deferred->queue.empty()) StartDeferredDestructors();  // After fork().
+  deferred->done.wait(lock, [] { return deferred->stats.depth == 0; });
+}
+
+DeferredDestructionStats GetDeferredDestructionStats() {
+  std::lock_guard<std::mutex> lock(deferred->mu);
+  return deferred->stats;
+}
+
+namespace {
+
+bool UsePythonAllocators() {
+#if PY_MAJOR_VERSION >= 3
+  static const bool use = [] {
+    const char* env = getenv("CLIF_PYTHON_ALLOCATORS");
+    return env != nullptr && env[0] != '\0' && env[0] != '0';
+  }();
+  return use;
+#else
+  return false;  // No tracemalloc.
+#endif
+}
+}  // namespace
+
+void* Allocate(size_t size) {
+#if PY_MAJOR_VERSION >= 3
+  if (UsePythonAllocators()) {
+    // PyMem_RawMalloc(0) returns a unique pointer as operator new does.
+    void* p = PyMem_RawMalloc(size);
+    if (p == nullptr) throw std::bad_alloc();
+    return p;
+  }
+#endif
+  return ::operator new(size);
+}
+
+void Deallocate(void* p) {
+#if PY_MAJOR_VERSION >= 3
+  if (UsePythonAllocators()) {
+    PyMem_RawFree(p);
+    return;
+  }
+#endif
+  ::operator delete(p);
+}
+
+namespace {
+
+std::vector<FreeList*>* freelists = nullptr;
+
+void ClearFreeLists() {
+  for (auto fl : *freelists) fl->Clear();
+}
+}  // namespace
+
+void* FreeList::Allocate() {
+#ifdef Py_DEBUG
+  ++allocs_;
+#endif
+  if (!blocks_.empty()) {
+#ifdef Py_DEBUG
+    ++hits_;
+#endif
+    void* p = blocks_.back();
+    blocks_.pop_back();
+    return p;
+  }
+  if (!registered_) {
+    registered_ = true;
+    blocks_.reserve(capacity_);
+    if (freelists == nullptr) {
+      freelists = new std::vector<FreeList*>;
+      Py_AtExit(ClearFreeLists);
+    }
+    freelists->push_back(this);
+  }
+  return ::clif::Allocate(size_);
+}
+
+void FreeList::Free(void* p) {
+  if (blocks_.size() < capacity_) {
+    blocks_.push_back(p);
+  } else {
+    Deallocate(p);
+  }
+}
+
+void FreeList::Clear() {
+  for (auto p : blocks_) Deallocate(p);
+  blocks_.clear();
+  capacity_ = 0;  // Python is finalized, do not keep blocks anymore.
+#ifdef Py_DEBUG
+  if (allocs_) {
+    fprintf(stderr, "CLIF freelist %s: %zu hits of %zu allocations\n",
+            name_, hits_, allocs_);
+  }
+#endif
+}
+
+PyObject* InstanceRegistry::Find(const void* cpp) const {
+  auto it = wrappers_.find(cpp);
+  return it == wrappers_.end() ? nullptr : it->second;
+}
+
+void InstanceRegistry::Add(const void* cpp, PyObject* py) {
+  if (cpp == nullptr) return;
+  Remove(py);
+  auto it = wrappers_.find(cpp);
+  if (it != wrappers_.end()) {
+    instances_.erase(it->second);
+    it->second = py;
+  } else {
+    wrappers_.emplace(cpp, py);
+  }
+  instances_.emplace(py, cpp);
+}
+
+void InstanceRegistry::Remove(PyObject* py) {
+  auto it = instances_.find(py);
+  if (it != instances_.end()) {
+    wrappers_.erase(it->second);
+    instances_.erase(it);
+  }
+}
+
 PyObject* DefaultArgMissedError(const char func[], char* argname) {
   PyErr_Format(PyExc_ValueError, "%s() argument %s needs a non-default value",
                func, argname);
@@ -163,5 +504,474 @@ string ExcStr(bool add_type) {
   Py_XDECREF(tb);
   return err;
 }
+
+// Native enums.
+//
+// Each enum is a heap type derived from (the static) Enum_Type, which derives
+// from int. Its metaclass EnumMeta_Type makes the class iterable and indexable
+// by name and turns a Class(value) call into a member lookup.
+// The enum class __dict__ keeps (interned names below):
+//   __members__         dict name -> member (including aliases)
+//   _member_list_       tuple of members in definition order (no aliases)
+//   _value2member_map_  dict value -> member
+//   _value2name_        dict value -> canonical member name
+namespace {
+
+#if PY_MAJOR_VERSION < 3
+PyTypeObject* const kIntType = &PyInt_Type;
+inline PyObject* IntValue(PyObject* o) { return PyNumber_Int(o); }
+inline PyObject* Intern(const char* s) { return PyString_InternFromString(s); }
+#else
+PyTypeObject* const kIntType = &PyLong_Type;
+inline PyObject* IntValue(PyObject* o) { return PyNumber_Long(o); }
+inline PyObject* Intern(const char* s) { return PyUnicode_InternFromString(s); }
+#endif
+
+PyTypeObject EnumMeta_Type = {PyVarObject_HEAD_INIT(&PyType_Type, 0)};
+PyTypeObject Enum_Type = {PyVarObject_HEAD_INIT(&PyType_Type, 0)};
+PyMappingMethods EnumMeta_AsMapping;
+PyObject *kMembers, *kMemberList, *kValue2Member, *kValue2Name;
+
+// Return a borrowed reference to the enum class __dict__[key].
+PyObject* EnumClassItem(PyObject* cls, PyObject* key) {
+  PyObject* d = reinterpret_cast<PyTypeObject*>(cls)->tp_dict;
+  PyObject* item = d ? PyDict_GetItem(d, key) : nullptr;
+  if (item == nullptr) {
+    PyErr_Format(PyExc_TypeError, "%s has no enum members",
+                 reinterpret_cast<PyTypeObject*>(cls)->tp_name);
+  }
+  return item;
+}
+
+PyObject* EnumMeta_Iter(PyObject* cls) {
+  PyObject* members = EnumClassItem(cls, kMemberList);
+  return members ? PyObject_GetIter(members) : nullptr;
+}
+
+Py_ssize_t EnumMeta_Length(PyObject* cls) {
+  PyObject* members = EnumClassItem(cls, kMemberList);
+  return members ? PyTuple_GET_SIZE(members) : -1;
+}
+
+PyObject* EnumMeta_GetItem(PyObject* cls, PyObject* name) {
+  PyObject* members = EnumClassItem(cls, kMembers);
+  if (members == nullptr) return nullptr;
+  PyObject* m = PyDict_GetItem(members, name);
+  if (m == nullptr) {
+    PyErr_SetObject(PyExc_KeyError, name);
+    return nullptr;
+  }
+  Py_INCREF(m);
+  return m;
+}
+
+PyObject* EnumMeta_Call(PyObject* cls, PyObject* args, PyObject* kw) {
+  PyObject* value;
+  if (kw && PyDict_Size(kw)) {
+    PyErr_Format(PyExc_TypeError, "%s() takes no keyword arguments",
+                 reinterpret_cast<PyTypeObject*>(cls)->tp_name);
+    return nullptr;
+  }
+  if (!PyArg_UnpackTuple(args, reinterpret_cast<PyTypeObject*>(cls)->tp_name,
+                         1, 1, &value)) {
+    return nullptr;
+  }
+  Py_INCREF(value);
+  return python::EnumFromValue(cls, value);
+}
+
+// Return a new reference to the member name.
+PyObject* EnumName(PyObject* self) {
+  PyObject* names = EnumClassItem(reinterpret_cast<PyObject*>(Py_TYPE(self)),
+                                  kValue2Name);
+  if (names == nullptr) return nullptr;
+  PyObject* name = PyDict_GetItem(names, self);
+  if (name == nullptr) {
+    PyErr_SetString(PyExc_ValueError, "not a valid enum member");
+    return nullptr;
+  }
+  Py_INCREF(name);
+  return name;
+}
+
+PyObject* Enum_GetName(PyObject* self, void*) {
+  return EnumName(self);
+}
+
+PyObject* Enum_GetValue(PyObject* self, void*) {
+  return IntValue(self);
+}
+
+PyObject* Enum_Str(PyObject* self) {
+  PyObject* name = EnumName(self);
+  if (name == nullptr) return nullptr;
+#if PY_MAJOR_VERSION < 3
+  PyObject* s = PyString_FromFormat("%s.%s", Py_TYPE(self)->tp_name,
+                                    PyString_AS_STRING(name));
+#else
+  PyObject* s = PyUnicode_FromFormat("%s.%U", Py_TYPE(self)->tp_name, name);
+#endif
+  Py_DECREF(name);
+  return s;
+}
+
+PyObject* Enum_Repr(PyObject* self) {
+  PyObject* name = EnumName(self);
+  if (name == nullptr) return nullptr;
+  PyObject* value = kIntType->tp_repr(self);
+  if (value == nullptr) {
+    Py_DECREF(name);
+    return nullptr;
+  }
+#if PY_MAJOR_VERSION < 3
+  PyObject* s = PyString_FromFormat("<%s.%s: %s>", Py_TYPE(self)->tp_name,
+                                    PyString_AS_STRING(name),
+                                    PyString_AS_STRING(value));
+#else
+  PyObject* s = PyUnicode_FromFormat("<%s.%U: %U>", Py_TYPE(self)->tp_name,
+                                     name, value);
+#endif
+  Py_DECREF(name);
+  Py_DECREF(value);
+  return s;
+}
+
+PyObject* Enum_Reduce(PyObject* self, PyObject*) {
+  return Py_BuildValue("O(N)", Py_TYPE(self), IntValue(self));
+}
+
+PyGetSetDef Enum_GetSet[] = {
+  {C("name"), Enum_GetName, nullptr, C("Enum member name")},
+  {C("value"), Enum_GetValue, nullptr, C("Enum member value")},
+  {}
+};
+
+PyMethodDef Enum_Methods[] = {
+  {C("__reduce__"), Enum_Reduce, METH_NOARGS, nullptr},
+  {}
+};
+
+bool EnumReady() {
+  if (Enum_Type.tp_flags & Py_TPFLAGS_READY) return true;
+  EnumMeta_AsMapping.mp_length = EnumMeta_Length;
+  EnumMeta_AsMapping.mp_subscript = EnumMeta_GetItem;
+  EnumMeta_Type.tp_name = "clif.EnumMeta";
+  EnumMeta_Type.tp_doc = "Metaclass for CLIF native enums";
+  EnumMeta_Type.tp_flags = Py_TPFLAGS_DEFAULT;
+  EnumMeta_Type.tp_base = &PyType_Type;
+  EnumMeta_Type.tp_as_mapping = &EnumMeta_AsMapping;
+  EnumMeta_Type.tp_iter = EnumMeta_Iter;
+  EnumMeta_Type.tp_call = EnumMeta_Call;
+  if (PyType_Ready(&EnumMeta_Type) < 0) return false;
+  Enum_Type.tp_name = "clif.Enum";
+  Enum_Type.tp_doc = "Base class for CLIF native enums";
+  Enum_Type.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE;
+  Enum_Type.tp_base = kIntType;
+  Enum_Type.tp_getset = Enum_GetSet;
+  Enum_Type.tp_methods = Enum_Methods;
+  Enum_Type.tp_repr = Enum_Repr;
+  Enum_Type.tp_str = Enum_Str;
+  if (PyType_Ready(&Enum_Type) < 0) return false;
+  kMembers = Intern("__members__");
+  kMemberList = Intern("_member_list_");
+  kValue2Member = Intern("_value2member_map_");
+  kValue2Name = Intern("_value2name_");
+  return kMembers && kMemberList && kValue2Member && kValue2Name;
+}
+
+// Create an enum member (new reference).
+PyObject* NewEnumMember(PyObject* cls, PyObject* value) {
+  PyObject* args = PyTuple_Pack(1, value);
+  if (args == nullptr) return nullptr;
+  PyObject* m = kIntType->tp_new(reinterpret_cast<PyTypeObject*>(cls), args,
+                                   nullptr);
+  Py_DECREF(args);
+  return m;
+}
+
+bool FillEnum(PyObject* cls, PyObject* items, PyObject* members,
+              PyObject* member_list, PyObject* v2m, PyObject* v2n) {
+  for (Py_ssize_t i = 0; i < PyTuple_GET_SIZE(items); ++i) {
+    PyObject *name, *value;
+    if (!PyArg_ParseTuple(PyTuple_GET_ITEM(items, i), "OO", &name, &value)) {
+      return false;
+    }
+    PyObject* m = PyDict_GetItem(v2m, value);
+    if (m != nullptr) {
+      Py_INCREF(m);  // An alias to the existing member.
+    } else {
+      m = NewEnumMember(cls, value);
+      if (m == nullptr ||
+          PyDict_SetItem(v2m, value, m) < 0 ||
+          PyDict_SetItem(v2n, value, name) < 0 ||
+          PyList_Append(member_list, m) < 0) {
+        Py_XDECREF(m);
+        return false;
+      }
+    }
+    bool ok = PyDict_SetItem(members, name, m) == 0 &&
+              PyObject_SetAttr(cls, name, m) == 0;
+    Py_DECREF(m);
+    if (!ok) return false;
+  }
+  return true;
+}
+}  // namespace
+
+PyObject* NewEnum(const char* name, const char* module, PyObject* items) {
+  if (!EnumReady()) return nullptr;
+  PyObject* cls = PyObject_CallFunction(
+      reinterpret_cast<PyObject*>(&EnumMeta_Type), C("s(O){s:s,s:()}"), name,
+      &Enum_Type, "__module__", module, "__slots__");
+  if (cls == nullptr) return nullptr;
+  PyObject* members = PyDict_New();
+  PyObject* member_list = PyList_New(0);
+  PyObject* v2m = PyDict_New();
+  PyObject* v2n = PyDict_New();
+  PyObject* member_tuple = nullptr;
+  bool ok = members && member_list && v2m && v2n &&
+            FillEnum(cls, items, members, member_list, v2m, v2n) &&
+            (member_tuple = PyList_AsTuple(member_list)) != nullptr &&
+            PyObject_SetAttr(cls, kMembers, members) == 0 &&
+            PyObject_SetAttr(cls, kMemberList, member_tuple) == 0 &&
+            PyObject_SetAttr(cls, kValue2Member, v2m) == 0 &&
+            PyObject_SetAttr(cls, kValue2Name, v2n) == 0;
+  Py_XDECREF(members);
+  Py_XDECREF(member_list);
+  Py_XDECREF(member_tuple);
+  Py_XDECREF(v2m);
+  Py_XDECREF(v2n);
+  if (!ok) {
+    Py_DECREF(cls);
+    return nullptr;
+  }
+  // Enums with members are final.
+  reinterpret_cast<PyTypeObject*>(cls)->tp_flags &= ~Py_TPFLAGS_BASETYPE;
+  return cls;
+}
+
+PyObject* EnumFromValue(PyObject* enum_cls, PyObject* value) {
+  if (value == nullptr) return nullptr;
+  PyObject* v2m = EnumClassItem(enum_cls, kValue2Member);
+  PyObject* m = v2m ? PyDict_GetItem(v2m, value) : nullptr;
+  if (m != nullptr) {
+    Py_INCREF(m);
+  } else if (v2m != nullptr && !PyErr_Occurred()) {
+    PyObject* r = PyObject_Repr(value);
+    if (r != nullptr) {
+#if PY_MAJOR_VERSION < 3
+      PyErr_Format(PyExc_ValueError, "%s is not a valid %s",
+                   PyString_AS_STRING(r),
+#else
+      PyErr_Format(PyExc_ValueError, "%U is not a valid %s", r,
+#endif
+                   reinterpret_cast<PyTypeObject*>(enum_cls)->tp_name);
+      Py_DECREF(r);
+    }
+  }
+  Py_DECREF(value);
+  return m;
+}
+
+// A clif.Buffer object owns C++ memory exported by the buffer protocol (see
+// MemoryView).
+namespace {
+
+struct BufferObject {
+  PyObject_HEAD
+  void* data;
+  int ndim;  // 1 or 2.
+  Py_ssize_t shape[2];
+  Py_ssize_t strides[2];  // C-contiguous.
+  const char* format;
+  void* owner;
+  void (*free_owner)(void*);
+  bool readonly;
+};
+
+PyTypeObject Buffer_Type = {PyVarObject_HEAD_INIT(&PyType_Type, 0)};
+PyBufferProcs Buffer_AsBuffer;
+
+int Buffer_GetBuffer(PyObject* self, Py_buffer* view, int flags) {
+  BufferObject* b = reinterpret_cast<BufferObject*>(self);
+  if (b->ndim > 1 && !(flags & PyBUF_ND)) {
+    PyErr_SetString(PyExc_BufferError,
+                    "clif.Buffer is 2-D, its shape must be requested");
+    view->obj = nullptr;
+    return -1;
+  }
+  // Without PyBUF_ND the consumer sees unsigned bytes (ndim 1, itemsize 1).
+  if (PyBuffer_FillInfo(view, self, b->data, b->shape[0] * b->strides[0],
+                        b->readonly, flags) < 0) {
+    return -1;
+  }
+  if (!(flags & PyBUF_ND)) return 0;
+  view->itemsize = b->strides[b->ndim - 1];
+  view->format = (flags & PyBUF_FORMAT) ? const_cast<char*>(b->format)
+                                        : nullptr;
+  view->ndim = b->ndim;
+  view->shape = b->shape;
+  view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? b->strides
+                                                           : nullptr;
+  return 0;
+}
+
+void Buffer_Dealloc(PyObject* self) {
+  BufferObject* b = reinterpret_cast<BufferObject*>(self);
+  b->free_owner(b->owner);
+  PyObject_Del(self);
+}
+
+bool BufferReady() {
+  if (Buffer_Type.tp_flags & Py_TPFLAGS_READY) return true;
+  Buffer_AsBuffer.bf_getbuffer = Buffer_GetBuffer;
+  Buffer_Type.tp_name = "clif.Buffer";
+  Buffer_Type.tp_doc = "C++ memory exported by the buffer protocol";
+  Buffer_Type.tp_basicsize = sizeof(BufferObject);
+  Buffer_Type.tp_dealloc = Buffer_Dealloc;
+  Buffer_Type.tp_as_buffer = &Buffer_AsBuffer;
+#if PY_MAJOR_VERSION < 3
+  Buffer_Type.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER;
+#else
+  Buffer_Type.tp_flags = Py_TPFLAGS_DEFAULT;
+#endif
+  return PyType_Ready(&Buffer_Type) == 0;
+}
+}  // namespace
+
+PyObject* MemoryView(void* data, int ndim, const Py_ssize_t* shape,
+                     Py_ssize_t itemsize, const char* format, void* owner,
+                     void (*free)(void*), bool readonly) {
+  assert(ndim == 1 || ndim == 2);
+  BufferObject* b = BufferReady() ? PyObject_New(BufferObject, &Buffer_Type)
+                                  : nullptr;
+  if (b == nullptr) {
+    free(owner);
+    return nullptr;
+  }
+  b->data = data;
+  b->ndim = ndim;
+  for (int i = ndim - 1; i >= 0; --i) {
+    b->shape[i] = shape[i];
+    b->strides[i] = itemsize;
+    itemsize *= shape[i];
+  }
+  b->format = format;
+  b->owner = owner;
+  b->free_owner = free;
+  b->readonly = readonly;
+  PyObject* view = PyMemoryView_FromObject(reinterpret_cast<PyObject*>(b));
+  Py_DECREF(b);
+  return view;
+}
+
+PyObject* NdArray(PyObject* view) {
+  // numpy.asarray or nullptr if NumPy is not available. Not a function-local
+  // static initializer: the import may release the GIL.
+  static PyObject* asarray = nullptr;
+  static bool imported = false;
+  if (view == nullptr) return nullptr;
+  if (!imported) {
+    PyObject* numpy = PyImport_ImportModule("numpy");
+    PyObject* f = nullptr;
+    if (numpy != nullptr) {
+      f = PyObject_GetAttrString(numpy, "asarray");
+      Py_DECREF(numpy);
+    }
+    if (f == nullptr) PyErr_Clear();
+    // Set only now: other threads calling in meanwhile also do the import.
+    if (imported) {
+      Py_XDECREF(f);
+    } else {
+      asarray = f;
+      imported = true;
+    }
+  }
+  if (asarray == nullptr) return view;
+  PyObject* a = PyObject_CallFunctionObjArgs(asarray, view, nullptr);
+  Py_DECREF(view);
+  return a;
+}
+
+bool IsWritableBuffer(PyObject* py) {
+  Py_buffer view;
+  if (!PyObject_CheckBuffer(py) ||
+      PyObject_GetBuffer(py, &view, PyBUF_WRITABLE) < 0) {
+    PyErr_Clear();  // ArgError reports the argument type.
+    return false;
+  }
+  PyBuffer_Release(&view);
+  return true;
+}
+
+PyObject* ReadInto(PyObject* py, const void* data, Py_ssize_t size,
+                   Py_ssize_t itemsize, bool (*is_format)(const char*)) {
+  Py_buffer view;
+  const int flags = is_format == nullptr ? PyBUF_WRITABLE :
+      PyBUF_WRITABLE | PyBUF_FORMAT | PyBUF_C_CONTIGUOUS;
+  if (PyObject_GetBuffer(py, &view, flags) < 0) return nullptr;
+  if (is_format != nullptr &&
+      (view.itemsize != itemsize || !is_format(view.format))) {
+    PyErr_Format(PyExc_TypeError, "buffer of '%s' items can't hold "
+                 "%zd-byte C++ numbers", view.format ? view.format : "B",
+                 itemsize);
+    PyBuffer_Release(&view);
+    return nullptr;
+  }
+  if (size > view.len) {
+    PyErr_Format(PyExc_ValueError, "%zd bytes do not fit in a buffer of %zd",
+                 size, view.len);
+    PyBuffer_Release(&view);
+    return nullptr;
+  }
+  // Do not block other threads while copying a lot (|view| keeps the exporter
+  // from resizing it).
+  if (size >= (1 << 20)) {
+    Py_BEGIN_ALLOW_THREADS
+    memcpy(view.buf, data, size);
+    Py_END_ALLOW_THREADS
+  } else {
+    memcpy(view.buf, data, size);
+  }
+  PyBuffer_Release(&view);
+#if PY_MAJOR_VERSION < 3
+  return PyInt_FromSsize_t(size);
+#else
+  return PyLong_FromSsize_t(size);
+#endif
+}
+
+PyObject* MemoryReport(const InstanceCounter* const counters[], size_t n) {
+  PyObject* report = PyDict_New();
+  if (report == nullptr) return nullptr;
+  for (size_t i = 0; i < n; ++i) {
+    const InstanceCounter& c = *counters[i];
+    PyObject* item = Py_BuildValue(
+        "{s:n,s:n}", "instances", static_cast<Py_ssize_t>(c.live),
+        "bytes", static_cast<Py_ssize_t>(c.live * c.size));
+    if (item == nullptr || PyDict_SetItemString(report, c.name, item) < 0) {
+      Py_XDECREF(item);
+      Py_DECREF(report);
+      return nullptr;
+    }
+    Py_DECREF(item);
+  }
+  return report;
+}
+
+PyObject* FlushDeferredDel(PyObject* module, PyObject* unused) {
+  Py_BEGIN_ALLOW_THREADS
+  FlushDeferredDestruction();
+  Py_END_ALLOW_THREADS
+  Py_RETURN_NONE;
+}
+
+PyObject* DeferredDelStats(PyObject* module, PyObject* unused) {
+  DeferredDestructionStats stats = GetDeferredDestructionStats();
+  return Py_BuildValue("{s:n,s:n,s:n}",
+                       "depth", static_cast<Py_ssize_t>(stats.depth),
+                       "max_depth", static_cast<Py_ssize_t>(stats.max_depth),
+                       "done", static_cast<Py_ssize_t>(stats.done));
+}
 }  // namespace python
 }  // namespace clif
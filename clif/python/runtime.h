@@ -23,7 +23,11 @@ standard headers on some systems, you must include Python.h before any standard
 headers are included.
 */
 #include <Python.h>
+#include <cstring>
+#include <functional>
 #include <string>
+#include <unordered_map>
+#include <vector>
 #include "clif/python/pyobj.h"
 #include "clif/python/shared_ptr.h"
 // CHECK_NOTNULL used in generated code, so it belongs here.
@@ -35,12 +39,15 @@ extern "C" void Clif_PyType_GenericFree(PyObject* self);
 extern "C" int Clif_PyType_Inconstructible(PyObject*, PyObject*, PyObject*);
 
 namespace clif {
+
+struct InstanceCounter;
+
 namespace python {
 
 string ExcStr(bool add_type = true);
 
 template <typename T>
-T* Get(clif::SharedPtr<T> sp, bool set_err = true) {
+T* Get(const clif::SharedPtr<T>& sp, bool set_err = true) {
   T* d = sp.get();
   if (set_err && d == nullptr) {
     PyErr_SetString(PyExc_ValueError,
@@ -48,6 +55,59 @@ T* Get(clif::SharedPtr<T> sp, bool set_err = true) {
   }
   return d;
 }
+
+template <typename T>
+T* Get(const clif::InlineValue<T>& v, bool set_err = true) {
+  T* d = v.get();
+  if (set_err && d == nullptr) {
+    PyErr_SetString(PyExc_ValueError, "Value is not initialized.");
+  }
+  return d;
+}
+
+// Native (int-derived) enum support, an alternative to the enum module.
+//
+// Create an enum class |name| (in |module|) from a tuple of (name, value)
+// pairs. Members are created once and stored as class attributes.
+PyObject* NewEnum(const char* name, const char* module, PyObject* items);
+
+// Return (a new reference to) the |enum_cls| member equal to |value|.
+// Steals the |value| reference.
+PyObject* EnumFromValue(PyObject* enum_cls, PyObject* value);
+
+// Return a memoryview of a C-contiguous |ndim|-D (1 or 2) array of |shape|
+// items of |itemsize| bytes (struct module |format|) at |data|, which belongs
+// to |owner|. Calls free(owner) when the view and all buffers exported from it
+// are released (or on error). Buffers requested without PyBUF_ND are plain
+// bytes; a 2-D array raises BufferError unless its shape is requested.
+PyObject* MemoryView(void* data, int ndim, const Py_ssize_t* shape,
+                     Py_ssize_t itemsize, const char* format, void* owner,
+                     void (*free)(void*), bool readonly = false);
+
+// Return numpy.asarray(|view|) if NumPy can be imported, else |view|.
+// Steals the |view| reference.
+PyObject* NdArray(PyObject* view);
+
+// Is |py| a writable (contiguous) buffer, like a bytearray? (@readinto)
+bool IsWritableBuffer(PyObject* py);
+
+// Copy |size| bytes at |data| to the start of writable buffer |py| and return
+// the number of bytes copied. Raise ValueError if they do not fit. Unless
+// |is_format| is nullptr, raise TypeError if the buffer items are not of
+// |itemsize| bytes and a struct module format accepted by is_format().
+PyObject* ReadInto(PyObject* py, const void* data, Py_ssize_t size,
+                   Py_ssize_t itemsize = 1,
+                   bool (*is_format)(const char*) = nullptr);
+
+// Return __clif_memory__() module function result for |counters|:
+// {class name: {"instances": live count, "bytes": estimated size}}.
+PyObject* MemoryReport(const InstanceCounter* const counters[], size_t n);
+
+// Module functions (METH_NOARGS) added with @deferred__del__ classes:
+// __flush_deferred_del__() calls FlushDeferredDestruction() without the GIL.
+PyObject* FlushDeferredDel(PyObject* module, PyObject* unused);
+// __deferred_del_stats__() returns DeferredDestructionStats as a dict.
+PyObject* DeferredDelStats(PyObject* module, PyObject* unused);
 }  // namespace python
 
 // Returns py.__class__.__name__ (needed for PY2 old style classes).
@@ -57,6 +117,11 @@ const char* ClassType(PyObject* py);
 // Load the base Python class.
 PyObject* ImportFQName(const string& full_class_name);
 
+// Check that wrapper |type| (before PyType_Ready) has the slots it would
+// inherit from its base wrapper, as inherited offsets would point into the base
+// wrapper layout.
+bool CheckBaseSlots(PyTypeObject* type);
+
 // Ensure we have enough args for callable.
 bool CallableNeedsNarguments(PyObject* callable, int nargs);
 
@@ -70,6 +135,106 @@ PyObject* DefaultArgMissedError(const char func[], char* argname);
 PyObject* ArgError(const char func[], char* argname, const char ctype[],
                    PyObject* arg);
 
+// Batched callbacks (see @batched): queue a call from a thread without the
+// GIL. The queue runs as one batch on the main Python thread (via a pending
+// call) or on FlushCallbacks().
+void QueueCallback(std::function<void()> call);
+
+// Run all queued callbacks now. Must be called with the GIL held.
+void FlushCallbacks();
+
+// Deferred destruction (see @deferred__del__): queue |dtor| to run on the CLIF
+// background destructor thread and return immediately. |dtor| must not use
+// Python API. Queued destructors are flushed at Python exit.
+void DeferDestruction(std::function<void()> dtor);
+
+template <typename T>
+void DeferDelete(T* p) {
+  DeferDestruction([p] { delete p; });
+}
+
+// Wait until all deferred destructors are done. Call it without the GIL if
+// destructors may wait for other Python threads.
+void FlushDeferredDestruction();
+
+struct DeferredDestructionStats {
+  size_t depth;      // Queued or running destructors.
+  size_t max_depth;  // Highest depth seen.
+  size_t done;       // Total finished destructors.
+};
+DeferredDestructionStats GetDeferredDestructionStats();
+
+// Storage of @freelist(N) class instances: keeps up to N freed blocks of the
+// wrapper object size for reuse. Not thread-safe (used with the GIL held).
+// All freelists are cleared at Python exit. Python debug build also reports
+// freelist hits there.
+class FreeList {
+ public:
+  FreeList(const char* name, size_t size, size_t capacity)
+      : name_(name), size_(size), capacity_(capacity) {}
+  void* Allocate();
+  void Free(void* p);
+  void Clear();
+
+ private:
+  const char* name_;
+  size_t size_;
+  size_t capacity_;
+  std::vector<void*> blocks_;
+  bool registered_ = false;
+#ifdef Py_DEBUG
+  size_t allocs_ = 0;
+  size_t hits_ = 0;
+#endif
+};
+
+// Base of generated wrapper structs: new and delete use clif::Allocate().
+struct Allocated {
+  static void* operator new(size_t size) { return Allocate(size); }
+  static void operator delete(void* p) { Deallocate(p); }
+  // Placement new for wrappers in freelist or GC object memory.
+  static void* operator new(size_t, void* p) { return p; }
+  static void operator delete(void*, void*) { }
+};
+
+// Construct wrapper W in |gcobj| allocated by _PyObject_GC_New(), keeping the
+// object header Python has set up there. Running PyObject_Init() again would
+// register the object twice (Py_TRACE_REFS and debug refcount builds).
+template <typename W>
+PyObject* ConstructInGcObject(void* gcobj) {
+  PyObject head;
+  memcpy(&head, gcobj, sizeof(head));
+  W* w = new(gcobj) W;
+  memcpy(gcobj, &head, sizeof(head));
+  return reinterpret_cast<PyObject*>(w);
+}
+
+// Live instances of a wrapped class (counted by its tp_alloc and tp_free) for
+// the __clif_memory__() module function. Python subclass instances are not
+// counted.
+struct InstanceCounter {
+  const char* name;
+  size_t size;  // Estimated bytes per instance.
+  size_t live;
+};
+
+// Python wrappers of @identity class instances by C++ instance address, so the
+// same C++ instance returned again gets the same (alive) wrapper.
+// Wrapper references are borrowed: it must Remove() itself when deleted.
+// Not thread-safe (used with the GIL held).
+class InstanceRegistry {
+ public:
+  // Return the (borrowed) wrapper registered for |cpp| or nullptr.
+  PyObject* Find(const void* cpp) const;
+  // Register |py| as the wrapper for |cpp| (replaces old registrations).
+  void Add(const void* cpp, PyObject* py);
+  void Remove(PyObject* py);
+
+ private:
+  std::unordered_map<const void*, PyObject*> wrappers_;
+  std::unordered_map<PyObject*, const void*> instances_;
+};
+
 // PyObject* "self" storage mixin for virtual method overrides.
 struct PyObj {
   py::Object pythis;
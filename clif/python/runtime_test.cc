@@ -0,0 +1,201 @@
+// Copyright 2017 Google Inc.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//      http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <sys/wait.h>
+#include <unistd.h>
+#include <chrono>  // NOLINT(build/c++11)
+#include <thread>  // NOLINT(build/c++11)
+
+#include "clif/python/runtime.h"
+#include "testing/base/public/gunit.h"
+
+namespace clif {
+namespace {
+
+TEST(DeferredDestructionTest, FlushInForkedChild) {
+  int done = 0;
+  DeferDestruction([&done] { ++done; });
+  FlushDeferredDestruction();
+  EXPECT_EQ(1, done);
+
+  // Keep the destructor thread busy at fork() with one more queued.
+  DeferDestruction([] {
+    std::this_thread::sleep_for(std::chrono::milliseconds(50));
+  });
+  DeferDestruction([&done] { ++done; });
+  pid_t pid = fork();
+  ASSERT_NE(-1, pid);
+  if (pid == 0) {
+    alarm(10);  // Fail instead of hanging.
+    int before = done;
+    DeferDestruction([&done] { ++done; });
+    FlushDeferredDestruction();
+    _exit(done > before ? 0 : 1);
+  }
+  int status;
+  ASSERT_EQ(pid, waitpid(pid, &status, 0));
+  ASSERT_TRUE(WIFEXITED(status));
+  EXPECT_EQ(0, WEXITSTATUS(status));
+
+  FlushDeferredDestruction();
+  EXPECT_EQ(2, done);
+}
+
+class EnumTest : public ::testing::Test {
+ protected:
+  EnumTest() {
+    Py_Initialize();
+    globals_ = PyModule_GetDict(PyImport_AddModule("__main__"));
+    PyObject* items = Py_BuildValue("((si)(si)(si))", "RED", 1, "GREEN", 2,
+                                    "CRIMSON", 1);
+    cls_ = python::NewEnum("Color", "__main__", items);
+    Py_DECREF(items);
+    EXPECT_NE(nullptr, cls_);
+    if (cls_) PyDict_SetItemString(globals_, "Color", cls_);
+  }
+  ~EnumTest() override { Py_XDECREF(cls_); }
+
+  // Returns true if Python expression |expr| is true.
+  bool IsTrue(const char* expr) {
+    PyObject* py = PyRun_String(expr, Py_eval_input, globals_, globals_);
+    EXPECT_NE(nullptr, py) << expr;
+    if (py == nullptr) {
+      PyErr_Print();
+      return false;
+    }
+    bool t = PyObject_IsTrue(py) == 1;
+    Py_DECREF(py);
+    return t;
+  }
+
+  PyObject* globals_;  // Borrowed.
+  PyObject* cls_;
+};
+
+TEST_F(EnumTest, Members) {
+  ASSERT_NE(nullptr, cls_);
+  EXPECT_TRUE(IsTrue("sorted(Color.__members__) == "
+                     "['CRIMSON', 'GREEN', 'RED']"));
+  EXPECT_TRUE(IsTrue("Color.__members__['CRIMSON'] is Color.RED"));
+  EXPECT_TRUE(IsTrue("list(Color) == [Color.RED, Color.GREEN] and "
+                     "len(Color) == 2"));
+  EXPECT_TRUE(IsTrue("Color['GREEN'] is Color.GREEN"));
+  EXPECT_TRUE(IsTrue("Color.RED.name == 'RED' and Color.RED.value == 1"));
+  EXPECT_TRUE(IsTrue("isinstance(Color.GREEN, int) and Color.GREEN == 2"));
+  EXPECT_TRUE(IsTrue("str(Color.GREEN) == 'Color.GREEN'"));
+  EXPECT_TRUE(IsTrue("repr(Color.GREEN) == '<Color.GREEN: 2>'"));
+}
+
+TEST_F(EnumTest, FromValue) {
+  ASSERT_NE(nullptr, cls_);
+  PyObject* m = python::EnumFromValue(cls_, PyLong_FromLong(2));
+  ASSERT_NE(nullptr, m);
+  PyObject* green = PyObject_GetAttrString(cls_, "GREEN");
+  EXPECT_EQ(green, m);
+  Py_XDECREF(green);
+  Py_DECREF(m);
+  EXPECT_TRUE(IsTrue("Color(1) is Color.RED"));
+  EXPECT_TRUE(IsTrue("Color(Color.GREEN) is Color.GREEN"));
+  // Unknown values are rejected.
+  EXPECT_EQ(nullptr, python::EnumFromValue(cls_, PyLong_FromLong(7)));
+  EXPECT_TRUE(PyErr_ExceptionMatches(PyExc_ValueError));
+  PyErr_Clear();
+  EXPECT_EQ(nullptr, python::EnumFromValue(cls_, nullptr));
+  PyObject* r = PyRun_String("Color(7)", Py_eval_input, globals_, globals_);
+  EXPECT_EQ(nullptr, r);
+  EXPECT_TRUE(PyErr_ExceptionMatches(PyExc_ValueError));
+  PyErr_Clear();
+}
+
+TEST_F(EnumTest, Pickle) {
+  ASSERT_NE(nullptr, cls_);
+  EXPECT_TRUE(IsTrue("Color.GREEN.__reduce__() == (Color, (2,))"));
+  ASSERT_EQ(0, PyRun_SimpleString("import pickle"));
+  EXPECT_TRUE(IsTrue("all(pickle.loads(pickle.dumps(Color.GREEN, p)) is "
+                     "Color.GREEN "
+                     "for p in range(pickle.HIGHEST_PROTOCOL + 1))"));
+}
+
+class MemoryViewTest : public ::testing::Test {
+ protected:
+  MemoryViewTest() { Py_Initialize(); }
+
+  // Return the clif.Buffer exporting a C++ double[2][3] (ndim 1 or 2).
+  PyObject* Exporter(int ndim) {
+    static double data[6] = {0, 1, 2, 3, 4, 5};
+    Py_ssize_t shape[2] = {2, 3};
+    if (ndim == 1) shape[0] = 6;
+    PyObject* view = python::MemoryView(data, ndim, shape, sizeof(double), "d",
+                                nullptr, [](void*) {}, true);
+    if (view == nullptr) return nullptr;
+    PyObject* b = PyMemoryView_GET_BUFFER(view)->obj;
+    Py_INCREF(b);
+    Py_DECREF(view);
+    return b;
+  }
+};
+
+TEST_F(MemoryViewTest, GetBuffer1D) {
+  PyObject* b = Exporter(1);
+  ASSERT_NE(nullptr, b);
+  Py_buffer view;
+  // Without PyBUF_ND it is a plain byte buffer.
+  ASSERT_EQ(0, PyObject_GetBuffer(b, &view, PyBUF_SIMPLE));
+  EXPECT_EQ(6 * sizeof(double), view.len);
+  EXPECT_EQ(1, view.ndim);
+  EXPECT_EQ(1, view.itemsize);
+  EXPECT_EQ(nullptr, view.format);
+  EXPECT_EQ(nullptr, view.shape);
+  PyBuffer_Release(&view);
+  ASSERT_EQ(0, PyObject_GetBuffer(b, &view, PyBUF_FORMAT));
+  EXPECT_EQ(1, view.itemsize);
+  EXPECT_STREQ("B", view.format);
+  PyBuffer_Release(&view);
+  ASSERT_EQ(0, PyObject_GetBuffer(b, &view, PyBUF_ND | PyBUF_FORMAT));
+  EXPECT_EQ(1, view.ndim);
+  EXPECT_EQ(sizeof(double), view.itemsize);
+  EXPECT_STREQ("d", view.format);
+  EXPECT_EQ(6, view.shape[0]);
+  EXPECT_EQ(nullptr, view.strides);
+  PyBuffer_Release(&view);
+  EXPECT_EQ(-1, PyObject_GetBuffer(b, &view, PyBUF_WRITABLE));
+  EXPECT_TRUE(PyErr_ExceptionMatches(PyExc_BufferError));
+  PyErr_Clear();
+  Py_DECREF(b);
+}
+
+TEST_F(MemoryViewTest, GetBuffer2D) {
+  PyObject* b = Exporter(2);
+  ASSERT_NE(nullptr, b);
+  Py_buffer view;
+  EXPECT_EQ(-1, PyObject_GetBuffer(b, &view, PyBUF_SIMPLE));
+  EXPECT_TRUE(PyErr_ExceptionMatches(PyExc_BufferError));
+  PyErr_Clear();
+  ASSERT_EQ(0, PyObject_GetBuffer(b, &view, PyBUF_ND));
+  EXPECT_EQ(2, view.ndim);
+  EXPECT_EQ(sizeof(double), view.itemsize);
+  EXPECT_EQ(2, view.shape[0]);
+  EXPECT_EQ(3, view.shape[1]);
+  EXPECT_EQ(nullptr, view.strides);
+  PyBuffer_Release(&view);
+  ASSERT_EQ(0, PyObject_GetBuffer(b, &view, PyBUF_RECORDS_RO));
+  EXPECT_EQ(3 * sizeof(double), view.strides[0]);
+  EXPECT_EQ(sizeof(double), view.strides[1]);
+  EXPECT_STREQ("d", view.format);
+  PyBuffer_Release(&view);
+  Py_DECREF(b);
+}
+
+}  // namespace
+}  // namespace clif
@@ -17,11 +17,37 @@
 #define CLIF_PYTHON_SHARED_PTR_H_
 
 #include <cstddef>
-#include <functional>
 #include <memory>
+#include <new>
+#include <type_traits>
+#include <utility>
 
 namespace clif {
 
+// Allocation of CLIF-owned memory (wrapper objects, SharedPtr control blocks).
+// With CLIF_PYTHON_ALLOCATORS=1 set in the environment it uses the Python raw
+// memory allocator (PyMem_RawMalloc, thread-safe), so Python 3 tracemalloc
+// traces it. Otherwise (and in Python 2) it uses the global operator new.
+// The mode is chosen once on the first call. Defined in runtime.cc.
+void* Allocate(size_t size);
+void Deallocate(void* p);
+
+// STL allocator using Allocate().
+template <typename T>
+struct Allocator {
+  using value_type = T;
+  Allocator() = default;
+  template <typename U>
+  Allocator(const Allocator<U>&) { }  // NOLINT(runtime/explicit)
+  T* allocate(size_t n) { return static_cast<T*>(Allocate(n * sizeof(T))); }
+  void deallocate(T* p, size_t) { Deallocate(p); }
+};
+
+template <typename T, typename U>
+bool operator==(const Allocator<T>&, const Allocator<U>&) { return true; }
+template <typename T, typename U>
+bool operator!=(const Allocator<T>&, const Allocator<U>&) { return false; }
+
 template <typename T>
 class SharedPtr;
 
@@ -58,38 +84,69 @@ class UnOwnedResource {
 // b) It was created from a shared pointer (std::shared_ptr) passed to Python.
 //
 // In all other cases, the shared pointer owns the pointee.
+//
+// The control block is created lazily on the first copy or MakeStdShared(),
+// which both take a const SharedPtr& but modify it. Like any other access to
+// a wrapped object's SharedPtr, they must be called with the GIL held (that
+// serializes them); concurrent copies of the same SharedPtr race otherwise.
 template <typename T>
 class SharedPtr {
  public:
-  SharedPtr() : deleter_(UnOwnedResource()) { }
+  SharedPtr() : owner_(nullptr), deleter_(nullptr) { }
 
   // Creates a shared pointer owns the data pointed to by |data|.
-  SharedPtr(T* data, OwnedResource res) : deleter_(res), sp_(data, deleter_) {
+  SharedPtr(T* data, OwnedResource res)
+      : owner_(nullptr), deleter_(data ? &Delete : nullptr), sp_(Alias(data)) {
   }
 
   // Creates a shared pointer which does not own the data pointed to by |data|.
-  SharedPtr(T* data, UnOwnedResource res): deleter_(res), sp_(data, deleter_) {
+  SharedPtr(T* data, UnOwnedResource res)
+      : owner_(nullptr), deleter_(nullptr), sp_(Alias(data)) {
   }
 
   // Captures ownership of the pointee.
   explicit SharedPtr(std::unique_ptr<T> up)
-      : deleter_(OwnedResource()), sp_(up.release(), deleter_) {
+      : SharedPtr(up.release(), OwnedResource()) {
   }
 
   // Creates a shared pointer which is essentially a copy of |sp|.
   // The new shared pointer does not own the pointee.
   explicit SharedPtr(std::shared_ptr<T> sp)
-      : deleter_(UnOwnedResource()), sp_(std::move(sp)) {
-    // When do not own the pointee and hence our deleter is not used.
+      : owner_(nullptr), deleter_(nullptr), sp_(std::move(sp)) {
   }
 
   // Does not take ownership of the pointee when a shared ptr is created from a
   // unique pointer having non-default deleter.
   template <typename D>
   explicit SharedPtr(std::unique_ptr<T, D> up)
-      : deleter_(UnOwnedResource()), sp_(up) {
+      : owner_(nullptr), deleter_(nullptr), sp_(std::move(up)) {
+  }
+
+  // Copies share the ownership, so it has to be moved to a control block.
+  // This modifies |other|, see the GIL note above.
+  SharedPtr(const SharedPtr& other) : deleter_(nullptr) {
+    other.Share();
+    owner_ = other.owner_;
+    sp_ = other.sp_;
   }
 
+  SharedPtr(SharedPtr&& other)
+      : owner_(other.owner_), deleter_(other.deleter_),
+        sp_(std::move(other.sp_)) {
+    other.Reset();
+  }
+
+  SharedPtr& operator=(SharedPtr other) {
+    Release();
+    owner_ = other.owner_;
+    deleter_ = other.deleter_;
+    sp_ = std::move(other.sp_);
+    other.Reset();
+    return *this;
+  }
+
+  ~SharedPtr() { Release(); }
+
   T *get() const {
     return sp_.get();
   }
@@ -114,6 +171,11 @@ class SharedPtr {
     return sp_ != n;
   }
 
+  // Returns true if this shared pointer is the only owner of the pointee.
+  bool unique() const {
+    return deleter_ || (owner_ && sp_.use_count() == 1);
+  }
+
   // Returns true if the ownership of the contained pointer could be renounced
   // successfully.
   bool Detach() {
@@ -128,14 +190,17 @@ class SharedPtr {
   // The raw pointer to the pointee is returned. Returns nullptr if the pointee
   // cannot be disowned safely.
   T *Renounce() {
+    T *obj = sp_.get();
+    if (deleter_) {
+      Reset();
+      return obj;
+    }
     // In the clif use case, if the shared ptr was created by Python,
-    // this->unique() will return false if the shared ptr was shared with C++
+    // use_count() will not be 1 if the shared ptr was shared with C++
     // (for example, passed as an argument to a function).
-    if (deleter_ && sp_.unique()) {
-      deleter_.Ignore();
-      T *obj = sp_.get();
-      sp_.reset();
-
+    if (owner_ && sp_.use_count() == 1) {
+      owner_->data = nullptr;
+      Reset();
       return obj;
     }
 
@@ -148,61 +213,88 @@ class SharedPtr {
   template <typename X>
   friend std::unique_ptr<X> MakeStdUnique(SharedPtr<X>* sp);
 
-  static void RealDelete(T* d) {
-    delete d;
-  }
-
-  static void NoopDelete(T* d) { }
-
-  class Deleter {
-   public:
-    explicit Deleter(OwnedResource res)
-        : del_func_(RealDelete), del_sp_(std::make_shared<bool>(true)) {
-    }
+  template <typename X>
+  friend bool SharesOwnership(const SharedPtr<X>& sp,
+                              const std::shared_ptr<X>& other);
 
-    explicit Deleter(UnOwnedResource res)
-        : del_func_(NoopDelete), del_sp_(std::make_shared<bool>(false)) {
-    }
+  // A std::shared_ptr without a control block (just holds the pointer).
+  static std::shared_ptr<T> Alias(T* data) {
+    return std::shared_ptr<T>(std::shared_ptr<T>(), data);
+  }
 
-    operator bool() const {
-      return *del_sp_.get();
-    }
+  // The owned pointee once shared lives in the std::shared_ptr control block
+  // (allocated with it by allocate_shared).
+  struct Owner {
+    Owner(T* d, void (*del)(T*)) : data(d), deleter(del) { }
+    ~Owner() { if (data) deleter(data); }
+    T* data;  // Set to nullptr when ownership is renounced.
+    void (*deleter)(T*);
+  };
 
-    void operator()(T* d) {
-      if (*del_sp_.get()) {
-        del_func_(d);
-      }
-    }
+  // Only taken by the owning constructor, so `delete T` is not instantiated
+  // for types that are never owned (e.g. with a non-public destructor).
+  static void Delete(T* data) {
+    delete data;
+  }
 
-    void Ignore() {
-      *del_sp_.get() = false;
+  // Move exclusive ownership of the pointee to a new control block.
+  // Not thread-safe: callers hold the GIL.
+  void Share() const {
+    if (deleter_) {
+      auto owner = std::allocate_shared<Owner>(Allocator<Owner>(), sp_.get(),
+                                               deleter_);
+      owner_ = owner.get();
+      sp_ = std::shared_ptr<T>(owner, sp_.get());
+      deleter_ = nullptr;
     }
+  }
 
-   private:
-    std::function<void(T*)> del_func_;
+  void Release() {
+    if (deleter_) deleter_(sp_.get());
+  }
 
-    // The boolean state has to be stored in a shared ptr as we need to save a
-    // copy of the deleter in SharedPtr. This way, the boolean state is shared
-    // between the copies in the base and derived classes.
-    std::shared_ptr<bool> del_sp_;
-  };
+  void Reset() {
+    owner_ = nullptr;
+    deleter_ = nullptr;
+    sp_.reset();
+  }
 
-  // The notion of pointee ownership is encapsulated in this deleter.
+  // The notion of pointee ownership: non-null iff we share the ownership of
+  // the pointee via sp_ control block (kept alive by it).
   // We cannot use std::get_deleter as it depends on RTTI. That is, it does not
-  // work with -fno-rtti. Hence, we have to store a copy of the deleter
-  // explicitly.
-  Deleter deleter_;
+  // work with -fno-rtti. Hence, we have to store a pointer explicitly.
+  mutable Owner* owner_;
+
+  // Non-null iff we own the pointee alone and sp_ has no control block yet.
+  // Most wrapped objects are never shared with C++ as std::shared_ptr, so it
+  // saves the control block allocation.
+  mutable void (*deleter_)(T*);
 
   // The actual shared ptr
-  std::shared_ptr<T> sp_;
+  mutable std::shared_ptr<T> sp_;
 };
 
 // Returns the std::shared_ptr encapsulated in |sp|.
+// A non-owned pointee gets a control block with a no-op deleter on the first
+// call, so the results have use_count() > 0 and share ownership with each
+// other (weak_ptr and owner_before work as for any std::shared_ptr).
+// As it may modify |sp|, it must be called with the GIL held.
 template <typename T>
 std::shared_ptr<T> MakeStdShared(const SharedPtr<T>& sp) {
+  sp.Share();
+  if (sp.sp_ && sp.sp_.use_count() == 0) {
+    sp.sp_ = std::shared_ptr<T>(sp.sp_.get(), [](T*) { }, Allocator<T>());
+  }
   return sp.sp_;
 }
 
+// Returns true if |sp| and |other| share the ownership of the same pointee.
+template <typename T>
+bool SharesOwnership(const SharedPtr<T>& sp, const std::shared_ptr<T>& other) {
+  return sp.get() == other.get() && !sp.deleter_ &&
+         !sp.sp_.owner_before(other) && !other.owner_before(sp.sp_);
+}
+
 // Returns an aliasing std::shared_ptr sharing resources with |sp|.
 template <typename Y, typename T>
 std::shared_ptr<T> MakeStdShared(const SharedPtr<Y>& sp, T* alias) {
@@ -224,6 +316,53 @@ SharedPtr<T> MakeShared(Args&&... args) {
   return SharedPtr<T>(new T(std::forward<Args>(args)...), OwnedResource());
 }
 
+// Storage of a @value class instance inside its Python object. It has the
+// pointer-like API of SharedPtr, but owns the instance inline (no heap
+// allocation). The instance is constructed with Emplace().
+template <typename T>
+class InlineValue {
+ public:
+  InlineValue() : set_(false) { }
+  InlineValue(const InlineValue&) = delete;
+  InlineValue& operator=(const InlineValue&) = delete;
+  ~InlineValue() { Reset(); }
+
+  template <typename... Args>
+  void Emplace(Args&&... args) {
+    Reset();
+    new (&data_) T(std::forward<Args>(args)...);
+    set_ = true;
+  }
+
+  void Reset() {
+    if (set_) {
+      set_ = false;
+      get()->~T();
+    }
+  }
+
+  T *get() const {
+    return set_ ? reinterpret_cast<T*>(const_cast<Storage*>(&data_)) : nullptr;
+  }
+
+  T &operator*() const {
+    return *get();
+  }
+
+  T *operator->() const {
+    return get();
+  }
+
+  explicit operator bool() const {
+    return set_;
+  }
+
+ private:
+  using Storage = typename std::aligned_storage<sizeof(T), alignof(T)>::type;
+  Storage data_;
+  bool set_;
+};
+
 }  // namespace clif
 
 #endif  // CLIF_PYTHON_SHARED_PTR_H_
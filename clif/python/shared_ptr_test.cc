@@ -22,6 +22,18 @@ class MyData {
   int a_, b_, c_;
 };
 
+class NoPublicDtor {
+ public:
+  static NoPublicDtor* Instance() {
+    static NoPublicDtor* instance = new NoPublicDtor;
+    return instance;
+  }
+
+ private:
+  NoPublicDtor() { }
+  ~NoPublicDtor() { }
+};
+
 class SharedPtrTest : public ::testing::Test {
 };
 
@@ -94,4 +106,79 @@ TEST_F(SharedPtrTest, TestCreationFromSharedPointer) {
   EXPECT_TRUE(sp2);
 }
 
+TEST_F(SharedPtrTest, TestOwnedPointeeLifetime) {
+  struct Counted {
+    explicit Counted(int* n) : n_(n) { ++*n_; }
+    ~Counted() { --*n_; }
+    int* n_;
+  };
+  int alive = 0;
+  {
+    SharedPtr<Counted> csp1(new Counted(&alive), OwnedResource());
+    SharedPtr<Counted> csp2 = csp1;
+    EXPECT_EQ(1, alive);
+    EXPECT_FALSE(MakeStdUnique(&csp1));
+  }
+  EXPECT_EQ(0, alive);
+
+  std::unique_ptr<Counted> up;
+  {
+    SharedPtr<Counted> csp(new Counted(&alive), OwnedResource());
+    up = MakeStdUnique(&csp);
+  }
+  EXPECT_EQ(1, alive);
+  up.reset();
+  EXPECT_EQ(0, alive);
+
+  {
+    SharedPtr<Counted> csp(new Counted(&alive), OwnedResource());
+    { SharedPtr<Counted> copy = csp; }  // Copy moves ownership to shared_ptr.
+    up = MakeStdUnique(&csp);
+    EXPECT_TRUE(up);
+    EXPECT_FALSE(csp);
+  }
+  EXPECT_EQ(1, alive);
+  up.reset();
+  EXPECT_EQ(0, alive);
+}
+
+TEST_F(SharedPtrTest, TestUnique) {
+  SharedPtr<MyData> csp(new MyData, OwnedResource());
+  EXPECT_TRUE(csp.unique());
+  {
+    std::shared_ptr<MyData> sp = MakeStdShared(csp);
+    EXPECT_FALSE(csp.unique());
+  }
+  EXPECT_TRUE(csp.unique());
+
+  std::unique_ptr<MyData> up(new MyData);
+  SharedPtr<MyData> unowned(up.get(), UnOwnedResource());
+  EXPECT_FALSE(unowned.unique());
+}
+
+TEST_F(SharedPtrTest, TestNoPublicDestructor) {
+  // Only the owning constructor needs a public destructor.
+  SharedPtr<NoPublicDtor> csp(NoPublicDtor::Instance(), UnOwnedResource());
+  SharedPtr<NoPublicDtor> copy = csp;
+  EXPECT_FALSE(copy.unique());
+  EXPECT_EQ(NoPublicDtor::Instance(), MakeStdShared(csp).get());
+}
+
+TEST_F(SharedPtrTest, TestStdSharedOfNotOwned) {
+  std::unique_ptr<MyData> up(new MyData);
+  SharedPtr<MyData> csp(up.get(), UnOwnedResource());
+
+  std::shared_ptr<MyData> sp1 = MakeStdShared(csp);
+  EXPECT_LE(1, sp1.use_count());
+  std::weak_ptr<MyData> wp = sp1;
+  EXPECT_EQ(up.get(), wp.lock().get());
+
+  std::shared_ptr<MyData> sp2 = MakeStdShared(csp);
+  EXPECT_FALSE(sp1.owner_before(sp2));
+  EXPECT_FALSE(sp2.owner_before(sp1));
+  EXPECT_TRUE(SharesOwnership(csp, sp2));
+  EXPECT_FALSE(MakeStdUnique(&csp));
+  EXPECT_TRUE(csp);
+}
+
 }  // namespace clif
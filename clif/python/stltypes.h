@@ -23,7 +23,10 @@ standard headers on some systems, you must include Python.h before any standard
 headers are included.
 */
 #include "Python.h"
+#include <algorithm>
+#include <array>
 #include <functional>
+#include <cstring>
 #include <deque>
 #include <list>
 #include <queue>
@@ -41,11 +44,26 @@ headers are included.
 
 namespace clif {
 
+// Return true if the current thread holds the GIL.
+inline bool HoldsGil() {
+#if PY_VERSION_HEX >= 0x03040000
+  return PyGILState_Check();
+#else
+  PyThreadState* ts = _PyThreadState_Current;
+  return ts != nullptr && ts == PyGILState_GetThisThreadState();
+#endif
+}
+
 // Ensure that the current thread is ready to call the Python C API.
+// Cheap no-op when the thread already holds the GIL (eg. C++ called a
+// callback argument synchronously from a wrapped function).
 struct GilLock {
-  GilLock() { threadstate_ = PyGILState_Ensure(); }
-  ~GilLock() { PyGILState_Release(threadstate_); }
+  GilLock()
+      : held_(HoldsGil()),
+        threadstate_(held_ ? PyGILState_LOCKED : PyGILState_Ensure()) {}
+  ~GilLock() { if (!held_) PyGILState_Release(threadstate_); }
  private:
+  bool held_;
   PyGILState_STATE threadstate_;
 };
 
@@ -70,22 +88,33 @@ namespace callback {
 
 using std::swap;
 
-// Convert arguments.
+// Convert arguments into the array a[], stop on the first error.
 
-inline void ArgIn(PyObject** a, Py_ssize_t idx) {}
+inline bool ArgIn(PyObject** a) { return true; }
 
 template<typename T1, typename... T>
-void ArgIn(PyObject** a, Py_ssize_t idx, T1&& c1, T&&... c) {
-  if (a && *a) {
-    // TODO: Pass real py::PostConv parameter.
-    PyObject* py = Clif_PyObjFrom(std::forward<T1>(c1), {});
-    if (!py) {
-      Py_CLEAR(*a);
-    } else {
-      PyTuple_SET_ITEM(*a, idx, py);
-    }
-    ArgIn(a, idx+1, std::forward<T>(c)...);
+bool ArgIn(PyObject** a, T1&& c1, T&&... c) {
+  // TODO: Pass real py::PostConv parameter.
+  *a = Clif_PyObjFrom(std::forward<T1>(c1), {});
+  return *a != nullptr && ArgIn(a+1, std::forward<T>(c)...);
+}
+
+// Call callable(*args) where args[-1] is a writable slot owned by the caller.
+inline PyObject* Call(PyObject* callable, PyObject** args, size_t nargs) {
+#if PY_VERSION_HEX >= 0x03090000
+  return PyObject_Vectorcall(callable, args,
+                             nargs | PY_VECTORCALL_ARGUMENTS_OFFSET, nullptr);
+#else
+  PyObject* pyargs = PyTuple_New(nargs);
+  if (pyargs == nullptr) return nullptr;
+  for (size_t i = 0; i < nargs; ++i) {
+    Py_INCREF(args[i]);
+    PyTuple_SET_ITEM(pyargs, i, args[i]);
   }
+  PyObject* result = PyObject_Call(callable, pyargs, nullptr);
+  Py_DECREF(pyargs);
+  return result;
+#endif
 }
 
 template<typename R>
@@ -133,28 +162,75 @@ class Func {
 
   R operator()(T... arg) const {
     GilLock holder;  // Hold GIL during Python callback.
-    int nargs = sizeof...(T);
-    PyObject* pyargs = PyTuple_New(nargs);
-    if (pyargs && nargs) ArgIn(&pyargs, 0, std::forward<T>(arg)...);
-    if (!pyargs || PyErr_Occurred()) {
-      // Error converting arg1 to Python.
-      Py_XDECREF(pyargs);
-      return ReturnValue<R>().FromPyValue(nullptr);
-    } else {
+    // Convert callback result to C++.
+    return ReturnValue<R>().FromPyValue(CallPython(std::forward<T>(arg)...));
+  }
+
+  // Call the Python callback (with the GIL held) and return its result.
+  PyObject* CallPython(T... arg) const {
+    constexpr size_t nargs = sizeof...(T);
+    // Arguments live on the stack, pyargs[0] is reserved for the callee.
+    PyObject* pyargs[nargs + 1] = {};
+    PyObject* result = nullptr;
+    if (ArgIn(pyargs + 1, std::forward<T>(arg)...)) {
       // Call the user function with our parameters.
-      PyObject* result = PyObject_CallObject(callback_.get(), pyargs);
-      Py_DECREF(pyargs);
-      // Convert callback result to C++.
-      return ReturnValue<R>().FromPyValue(result);
-    }
+      result = Call(callback_.get(), pyargs + 1, nargs);
+    }  // else error converting an argument to Python.
+    for (size_t i = 1; i <= nargs; ++i) Py_XDECREF(pyargs[i]);
+    return result;
   }
 
+  PyObject* callable() const { return callback_.get(); }
+
  private:
   // User-provided Python callback.
   // shared_ptr provides copy safety for this functor used for std::function arg
   std::shared_ptr<PyObject> callback_;
 };
 
+// Can all argument types T be copied to a queued call? (Pointers could dangle
+// by the time it runs.)
+template<typename... T>
+struct AreQueueable : std::true_type {};
+template<typename T, typename... U>
+struct AreQueueable<T, U...> : std::integral_constant<bool,
+    !std::is_pointer<typename std::decay<T>::type>::value &&
+    !std::is_rvalue_reference<T>::value &&
+    std::is_copy_constructible<typename std::decay<T>::type>::value &&
+    AreQueueable<U...>::value> {};
+
+// Callback wrapper for @batched functions: calls made without the GIL are
+// queued (with copies of the arguments) and the caller does not wait.
+template<typename... T>
+class BatchedFunc {
+  static_assert(AreQueueable<T...>::value, "@batched callback parameters "
+                "must be copyable values (not pointers or move-only types)");
+
+ public:
+  explicit BatchedFunc(PyObject* callable) : func_(callable) {}
+
+  void operator()(T... arg) const {
+    if (HoldsGil()) {
+      FlushCallbacks();  // Keep calls in order.
+      func_(std::forward<T>(arg)...);
+      return;
+    }
+    Func<void, T...> f = func_;
+    QueueCallback([f, arg...]() mutable {
+      // Nobody to report the error to, so print it like in __del__.
+      PyObject* result = f.CallPython(arg...);
+      if (result == nullptr) {
+        PyErr_WriteUnraisable(f.callable());
+      } else {
+        Py_DECREF(result);
+      }
+    });
+  }
+
+ private:
+  Func<void, T...> func_;
+};
+
 }  // namespace callback
 
 template<typename R, typename... T>
@@ -186,12 +262,34 @@ bool Clif_PyObjAs(PyObject* py, std::function<R(T...)>* c) {
     PyErr_SetString(PyExc_TypeError, "callable expected");
     return false;
   }
+  // Python function made by FunctionCapsule with the same signature: take the
+  // C++ function back to avoid C++ -> Python -> C++ calls.
+  if (PyCFunction_Check(py)) {
+    PyObject* caps = PyCFunction_GET_SELF(py);
+    const char* name = typeid(std::function<R(T...)>).name();
+    if (caps && PyCapsule_IsValid(caps, name)) {
+      *c = *reinterpret_cast<std::function<R(T...)>*>(
+          PyCapsule_GetPointer(caps, name));
+      return true;
+    }
+  }
   // Ensure we have enough args for callback. (Catch T* output args misuse.)
   if (!CallableNeedsNarguments(py, sizeof...(T))) return false;
   *c = callback::Func<R, T...>(py);
   return true;
 }
 
+// Convert a callback parameter of a @batched function.
+template<typename... T>
+bool Clif_PyObjAsBatched(PyObject* py, std::function<void(T...)>* c) {
+  if (!Clif_PyObjAs(py, c)) return false;
+  // Python callable (not unwrapped C++ function) needs the GIL.
+  if (c->template target<callback::Func<void, T...>>()) {
+    *c = callback::BatchedFunc<T...>(py);
+  }
+  return true;
+}
+
 // ------------------------------------------------------------------
 
 template<typename T>
@@ -205,6 +303,43 @@ bool Clif_PyObjAs(PyObject* py, std::unique_ptr<T>* c) {
 
 // ------------------------------------------------------------------
 
+namespace py {
+
+// Length of sequence |py| (-1 with TypeError if it is not a sequence).
+// Exact lists and tuples are read directly; other sequences (str too) go
+// through the sequence protocol, and sets, dicts and iterators are rejected.
+inline Py_ssize_t SequenceLength(PyObject* py, const char* expected) {
+  if (PyList_CheckExact(py) || PyTuple_CheckExact(py)) {
+    return PySequence_Fast_GET_SIZE(py);
+  }
+  if (!PySequence_Check(py)) {
+    PyErr_Format(PyExc_TypeError, "expected %s, got %s", expected,
+                 Py_TYPE(py)->tp_name);
+    return -1;
+  }
+  return PySequence_Length(py);
+}
+
+// Convert item |i| of sequence |py| to |c|.
+template<typename T>
+bool SequenceItemAs(PyObject* py, Py_ssize_t i, T* c) {
+  PyObject* item;
+  // An earlier item conversion may have run Python code that shrank a list.
+  if (PyTuple_CheckExact(py) ||
+      (PyList_CheckExact(py) && i < PyList_GET_SIZE(py))) {
+    item = PySequence_Fast_GET_ITEM(py, i);
+    Py_INCREF(item);
+  } else {
+    item = PySequence_GetItem(py, i);
+    if (item == nullptr) return false;
+  }
+  bool ok = Clif_PyObjAs(item, c);
+  Py_DECREF(item);
+  return ok;
+}
+
+}  // namespace py
+
 // pair
 template<typename T, typename U>
 PyObject* Clif_PyObjFrom(const std::pair<T, U>& c, py::PostConv pc)  {
@@ -226,7 +361,7 @@ PyObject* Clif_PyObjFrom(const std::pair<T, U>& c, py::PostConv pc)  {
 }
 template<typename T, typename U>
 bool Clif_PyObjAs(PyObject* py, std::pair<T, U>* c) {
-  Py_ssize_t len = PySequence_Length(py);
+  Py_ssize_t len = py::SequenceLength(py, "a sequence");
   if (len != 2) {
     if (len != -1) {
       PyErr_Format(PyExc_ValueError, "expected a sequence"
@@ -237,9 +372,9 @@ bool Clif_PyObjAs(PyObject* py, std::pair<T, U>* c) {
   using Key = typename std::remove_const<T>::type;
   using Val = typename std::remove_const<U>::type;
   Key k;
-  if (!Clif_PyObjAs(PySequence_GetItem(py, 0), &k)) return false;
   Val v;
-  if (!Clif_PyObjAs(PySequence_GetItem(py, 1), &v)) return false;
+  if (!py::SequenceItemAs(py, 0, &k) ||
+      !py::SequenceItemAs(py, 1, &v)) return false;
   const_cast<Key&>(c->first) = std::move(k);
   const_cast<Val&>(c->second) = std::move(v);
   return true;
@@ -355,11 +490,9 @@ template<size_t I> struct Tuple {
   }
 
   template<typename... T>
-  static bool As(PyObject* pytuple, std::tuple<T...>* c) {
-    if (!Clif_PyObjAs(PyTuple_GET_ITEM(pytuple, I-1), &std::get<I-1>(*c))) {
-      return false;
-    }
-    return Tuple<I-1>::As(pytuple, c);
+  static bool As(PyObject* seq, std::tuple<T...>* c) {
+    return (py::SequenceItemAs(seq, I-1, &std::get<I-1>(*c)) &&
+            Tuple<I-1>::As(seq, c));
   }
 };
 
@@ -386,15 +519,15 @@ PyObject* Clif_PyObjFrom(const std::tuple<T...>& c, py::PostConv pc) {
 template<typename... T>
 bool Clif_PyObjAs(PyObject* py, std::tuple<T...>* c) {
   assert(c != nullptr);
-  Py_ssize_t len = PyTuple_Size(py);
-  if (len != _TUPLE_SIZE) {
+  Py_ssize_t len = py::SequenceLength(py, "a tuple");
+  if (len != static_cast<Py_ssize_t>(sizeof...(T))) {
     if (len != -1) {
       PyErr_Format(PyExc_ValueError, "expected a tuple"
-                   " with len==%zd, got %zd", _TUPLE_SIZE, len);
+                   " with len==%zd, got %zd", sizeof...(T), len);
     }
     return false;
   }
-  return py::Tuple<_TUPLE_SIZE>::As(py, c);
+  return py::Tuple<sizeof...(T)>::As(py, c);
 }
 #undef _TUPLE_SIZE
 
@@ -481,6 +614,118 @@ PyObject* Clif_PyObjFrom(std::map<T, U, Args...>&& c, py::PostConv pc) {
   return py::DictFromCont(std::move(c), pc);
 }
 
+// buffer
+namespace py {
+template<typename T>
+struct IsNumeric : std::integral_constant<bool, std::is_arithmetic<T>::value &&
+                                                !std::is_same<T, bool>::value> {
+};
+
+// Struct module format of a numeric type T.
+template<typename T>
+constexpr const char* NumericFormat() {
+  static_assert(IsNumeric<T>::value, "buffer<> items must be numbers");
+  return std::is_floating_point<T>::value ? (sizeof(T) == 4 ? "f" : "d") :
+         std::is_signed<T>::value ?
+             (sizeof(T) == 1 ? "b" : sizeof(T) == 2 ? "h" :
+              sizeof(T) == 4 ? "i" : "q") :
+             (sizeof(T) == 1 ? "B" : sizeof(T) == 2 ? "H" :
+              sizeof(T) == 4 ? "I" : "Q");
+}
+
+// Move a numeric vector to a memoryview (CLIF type buffer<T> result), so its
+// items are not converted to Python objects.
+template<typename T, typename... Args>
+PyObject* BufferFrom(std::vector<T, Args...>&& c) {
+  using V = std::vector<T, Args...>;
+  V* v = new V(std::move(c));
+  const Py_ssize_t shape[] = {static_cast<Py_ssize_t>(v->size())};
+  return python::MemoryView(v->data(), 1, shape, sizeof(T),
+                            NumericFormat<T>(), v,
+                            [](void* p) { delete static_cast<V*>(p); });
+}
+template<typename T, typename... Args>
+PyObject* BufferFrom(const std::vector<T, Args...>& c) {
+  return BufferFrom(std::vector<T, Args...>(c));
+}
+
+// Copy rows of numbers (of the same size) to a 2-D memoryview.
+template<typename T, typename... R, typename... Args>
+PyObject* BufferFrom(const std::vector<std::vector<T, R...>, Args...>& c) {
+  const Py_ssize_t shape[] = {static_cast<Py_ssize_t>(c.size()),
+                              c.empty() ? 0 : Py_ssize_t(c[0].size())};
+  std::vector<T>* v = new std::vector<T>;
+  v->reserve(shape[0] * shape[1]);
+  for (const auto& row : c) {
+    if (static_cast<Py_ssize_t>(row.size()) != shape[1]) {
+      PyErr_Format(PyExc_ValueError, "buffer<> rows must have the same size, "
+                   "got %zd and %zd items", shape[1],
+                   static_cast<Py_ssize_t>(row.size()));
+      delete v;
+      return nullptr;
+    }
+    v->insert(v->end(), row.begin(), row.end());
+  }
+  return python::MemoryView(
+      v->data(), 2, shape, sizeof(T), NumericFormat<T>(), v,
+      [](void* p) { delete static_cast<std::vector<T>*>(p); });
+}
+template<typename T, typename... R, typename... Args>
+PyObject* BufferFrom(std::vector<std::vector<T, R...>, Args...>&& c) {
+  const std::vector<std::vector<T, R...>, Args...>& rows = c;
+  return BufferFrom(rows);
+}
+
+template<typename T, std::size_t N>
+PyObject* BufferFrom(const std::array<T, N>& c) {
+  using A = std::array<T, N>;
+  A* a = new A(c);
+  const Py_ssize_t shape[] = {N};
+  return python::MemoryView(a->data(), 1, shape, sizeof(T),
+                            NumericFormat<T>(), a,
+                            [](void* p) { delete static_cast<A*>(p); });
+}
+template<typename T, std::size_t N, std::size_t M>
+PyObject* BufferFrom(const std::array<std::array<T, N>, M>& c) {
+  using A = std::array<std::array<T, N>, M>;
+  static_assert(sizeof(A) == M * N * sizeof(T), "std::array has padding");
+  A* a = new A(c);
+  const Py_ssize_t shape[] = {M, N};
+  return python::MemoryView(a->data(), 2, shape, sizeof(T),
+                            NumericFormat<T>(), a,
+                            [](void* p) { delete static_cast<A*>(p); });
+}
+
+inline bool IsNumericFormat(const char* format, char kind);
+
+// Does a buffer with struct module |format| hold numbers of type T?
+template<typename T>
+bool IsFormatOf(const char* format) {
+  return IsNumericFormat(format, std::is_floating_point<T>::value ? 'f' :
+                                 std::is_signed<T>::value ? 'i' : 'u');
+}
+
+// Copy a @readinto output parameter to the writable buffer |py|. Bytes go to
+// any buffer (as with file.readinto), wider numbers only to a buffer of the
+// same numbers (like array('d') for std::vector<double>).
+inline PyObject* ReadInto(PyObject* py, const std::string& c) {
+  return python::ReadInto(py, c.data(), c.size());
+}
+template<typename T, typename... Args>
+PyObject* ReadInto(PyObject* py, const std::vector<T, Args...>& c) {
+  static_assert(IsNumeric<T>::value, "@readinto list items must be numbers");
+  return python::ReadInto(py, c.data(), c.size() * sizeof(T), sizeof(T),
+                          sizeof(T) == 1 ? nullptr : &IsFormatOf<T>);
+}
+
+// Convert to a NumPy array if NumPy is available (CLIF type ndarray<T> or
+// ndarray<list<T>> result), else to a memoryview as BufferFrom.
+template<typename C>
+PyObject* NdArrayFrom(C&& c) {
+  return python::NdArray(BufferFrom(std::forward<C>(c)));
+}
+}  // namespace py
+
 // set
 template<typename T, typename... Args>
 PyObject* Clif_PyObjFrom(const std::unordered_set<T, Args...>& c,
@@ -500,6 +745,20 @@ namespace py {
 // container of T via functor Inserter.
 template<typename T, typename Inserter>
 bool IterToCont(PyObject* py, Inserter add) {
+  if (PyList_CheckExact(py) || PyTuple_CheckExact(py)) {
+    // Index items directly. The size is checked on each step as converting
+    // an item may run Python code that changes the list.
+    for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(py); ++i) {
+      PyObject* el = PySequence_Fast_GET_ITEM(py, i);
+      Py_INCREF(el);  // Keep it alive if removed from the list meanwhile.
+      typename std::remove_const<T>::type item;
+      bool ok = Clif_PyObjAs(el, &item);
+      Py_DECREF(el);
+      if (!ok) return false;
+      add(std::move(item));
+    }
+    return true;
+  }
   PyObject* it = PyObject_GetIter(py);
   if (it == nullptr) return false;
   PyObject *el;
@@ -517,17 +776,173 @@ bool IterToCont(PyObject* py, Inserter add) {
   return !PyErr_Occurred();
 }
 
-// Helper function to walk Python dict (via items()) and put converted elements
-// to a C++ container via functor add.
+// Number of items in an exact list or tuple |py| (to reserve space), else 0.
+inline Py_ssize_t ExactSequenceSize(PyObject* py) {
+  return (PyList_CheckExact(py) || PyTuple_CheckExact(py)) ?
+      PySequence_Fast_GET_SIZE(py) : 0;
+}
+
+// Does a buffer with struct module |format| hold items of numeric |kind|
+// ('i' signed, 'u' unsigned integers or 'f' floating point) in native byte
+// order? (The item size is checked separately.)
+inline bool IsNumericFormat(const char* format, char kind) {
+  if (format == nullptr) return kind == 'u';  // Unsigned bytes.
+#ifdef WORDS_BIGENDIAN
+  const bool little = false;
+#else
+  const bool little = true;
+#endif
+  if (*format == '@' || *format == '=' || (*format == '<' && little) ||
+      ((*format == '>' || *format == '!') && !little)) {
+    ++format;
+  }
+  if (format[0] == '\0' || format[1] != '\0') return false;
+  switch (kind) {
+    case 'i': return strchr("bhilqn", format[0]) != nullptr;
+    case 'u': return strchr("BHILQN", format[0]) != nullptr;
+    case 'f': return strchr("fd", format[0]) != nullptr;
+  }
+  return false;
+}
+
+// Call copy(data, shape) on a |ndim|-D (1 or 2) C-contiguous buffer |py| of
+// T items. Return false without an error set if |py| is not such a buffer or
+// copy() returns false (on a shape mismatch, it must not use Python API).
+template<typename T, typename F>
+bool CopyFromBuffer(PyObject* py, int ndim, F copy) {
+  if (!PyObject_CheckBuffer(py)) return false;
+  Py_buffer view;
+  if (PyObject_GetBuffer(py, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0) {
+    PyErr_Clear();  // Let the element-wise conversion try (and report).
+    return false;
+  }
+  const char kind = std::is_floating_point<T>::value ? 'f' :
+                    std::is_signed<T>::value ? 'i' : 'u';
+  bool ok = (view.ndim == ndim && view.itemsize == sizeof(T) &&
+             IsNumericFormat(view.format, kind));
+  if (ok) {
+    const Py_ssize_t len = view.len / sizeof(T);
+    const Py_ssize_t* shape = ndim == 1 ? &len : view.shape;
+    const T* data = static_cast<const T*>(view.buf);
+    // Do not block other threads while copying a large buffer (|view| keeps
+    // the exporter from resizing it).
+    if (view.len >= (1 << 20)) {
+      Py_BEGIN_ALLOW_THREADS
+      ok = copy(data, shape);
+      Py_END_ALLOW_THREADS
+    } else {
+      ok = copy(data, shape);
+    }
+  }
+  PyBuffer_Release(&view);
+  return ok;
+}
+
+// Copy |n| numbers to a vector or array |c| (which must have size |n|).
+template<typename T, typename... Args>
+bool CopyRow(const T* data, Py_ssize_t n, std::vector<T, Args...>* c) {
+  c->assign(data, data + n);
+  return true;
+}
+template<typename T, std::size_t N>
+bool CopyRow(const T* data, Py_ssize_t n, std::array<T, N>* c) {
+  if (n != N) return false;
+  std::copy(data, data + n, c->begin());
+  return true;
+}
+
+template<typename T, typename... Args>
+bool ResizeRows(Py_ssize_t n, std::vector<T, Args...>* c) {
+  c->resize(n);
+  return true;
+}
+template<typename T, std::size_t N>
+bool ResizeRows(Py_ssize_t n, std::array<T, N>* c) {
+  return n == N;
+}
+
+// Copy 1-D C-contiguous buffer |py| of T items into vector or array |c| at
+// once. Return false without an error set if |py| is not such a buffer.
+template<typename T, typename C>
+bool BufferToVector(PyObject* py, C* c, std::true_type /* numeric T */) {
+  return CopyFromBuffer<T>(py, 1, [c](const T* data, const Py_ssize_t* shape) {
+    return CopyRow(data, shape[0], c);
+  });
+}
+
+template<typename T, typename C>
+bool BufferToVector(PyObject*, C*, std::false_type) { return false; }
+
+// Is T a vector or array of numbers (a matrix row)?
+template<typename T>
+struct IsNumericRow : std::false_type {};
+template<typename T, typename... Args>
+struct IsNumericRow<std::vector<T, Args...>> : IsNumeric<T> {};
+template<typename T, std::size_t N>
+struct IsNumericRow<std::array<T, N>> : IsNumeric<T> {};
+
+// Copy 2-D C-contiguous buffer |py| (like a NumPy matrix) row by row into
+// vector or array |c| of numeric rows. Return false without an error set if
+// |py| is not such a buffer.
+template<typename C>
+bool BufferToRows(PyObject* py, C* c, std::true_type /* numeric rows */) {
+  using T = typename C::value_type::value_type;
+  return CopyFromBuffer<T>(py, 2, [c](const T* data, const Py_ssize_t* shape) {
+    if (!ResizeRows(shape[0], c)) return false;
+    for (Py_ssize_t i = 0; i < shape[0]; ++i) {
+      if (!CopyRow(data + i * shape[1], shape[1], &(*c)[i])) return false;
+    }
+    return true;
+  });
+}
+
+template<typename C>
+bool BufferToRows(PyObject*, C*, std::false_type) { return false; }
+
+// Helper function to walk Python dict (directly or via items()) and put
+// converted elements to a C++ container via functor add(key&&, value&&).
 template<typename T, typename U, typename F>
 bool ItemsToMap(PyObject* py, F add) {
+  if (PyDict_CheckExact(py)) {
+    // Conversions may run Python code that changes the dict. As Python dict
+    // iterators do, fail if its size changed or more or fewer items than it
+    // had were seen (keys were replaced).
+    const Py_ssize_t size = PyDict_Size(py);
+    Py_ssize_t pos = 0, seen = 0;
+    PyObject *k, *v;
+    while (PyDict_Next(py, &pos, &k, &v)) {
+      if (++seen > size) break;
+      typename std::remove_const<T>::type key;
+      typename std::remove_const<U>::type value;
+      Py_INCREF(k);
+      Py_INCREF(v);
+      bool ok = Clif_PyObjAs(k, &key) && Clif_PyObjAs(v, &value);
+      Py_DECREF(k);
+      Py_DECREF(v);
+      if (!ok) return false;
+      if (PyDict_Size(py) != size) {
+        PyErr_SetString(PyExc_RuntimeError,
+                        "dictionary changed size during iteration");
+        return false;
+      }
+      add(std::move(key), std::move(value));
+    }
+    if (seen != size) {
+      PyErr_SetString(PyExc_RuntimeError,
+                      "dictionary keys changed during iteration");
+      return false;
+    }
+    return true;
+  }
 #if PY_MAJOR_VERSION < 3
   py = PyObject_CallMethod(py, C("iteritems"), nullptr);
 #else
   py = PyObject_CallMethod(py, C("items"), nullptr);
 #endif
   if (py == nullptr) return false;
-  bool ok = py::IterToCont<std::pair<T, U>>(py, add);
+  bool ok = py::IterToCont<std::pair<T, U>>(py, [&add](std::pair<T, U>&& i) {  //NOLINT: build/c++11
+    add(std::move(i.first), std::move(i.second));
+  });
   Py_DECREF(py);
   return ok;
 }
@@ -537,17 +952,49 @@ bool ItemsToMap(PyObject* py, F add) {
 template<typename T, typename... Args>
 bool Clif_PyObjAs(PyObject* py, std::vector<T, Args...>* c) {
   assert(c != nullptr);
+  // Copy numbers from a buffer (like array.array, bytes or a NumPy array) in
+  // bulk.
+  if (!PyList_CheckExact(py) && !PyTuple_CheckExact(py) &&
+      (py::BufferToVector<T>(py, c, py::IsNumeric<T>()) ||
+       py::BufferToRows(py, c, py::IsNumericRow<T>()))) {
+    return true;
+  }
   c->clear();
+  c->reserve(py::ExactSequenceSize(py));
   return py::IterToCont<T>(py, [&c](T&& i) {  //NOLINT: build/c++11
     c->push_back(std::move(i));
   });
 }
 
+// fixed size list
+template<typename T, std::size_t N>
+bool Clif_PyObjAs(PyObject* py, std::array<T, N>* c) {
+  assert(c != nullptr);
+  if (!PyList_CheckExact(py) && !PyTuple_CheckExact(py) &&
+      (py::BufferToVector<T>(py, c, py::IsNumeric<T>()) ||
+       py::BufferToRows(py, c, py::IsNumericRow<T>()))) {
+    return true;
+  }
+  std::size_t n = 0;
+  if (!py::IterToCont<T>(py, [&c, &n](T&& i) {  //NOLINT: build/c++11
+    if (n < N) (*c)[n] = std::move(i);
+    ++n;
+  })) {
+    return false;
+  }
+  if (n != N) {
+    PyErr_Format(PyExc_ValueError, "expected %zu items, got %zu", N, n);
+    return false;
+  }
+  return true;
+}
+
 // set
 template<typename T, typename... Args>
 bool Clif_PyObjAs(PyObject* py, std::unordered_set<T, Args...>* c) {
   assert(c != nullptr);
   c->clear();
+  c->reserve(py::ExactSequenceSize(py));
   return py::IterToCont<T>(py, [&c](T&& i) {  //NOLINT: build/c++11
     c->insert(std::move(i));
   });
@@ -566,17 +1013,25 @@ template<typename T, typename U, typename... Args>
 bool Clif_PyObjAs(PyObject* py, std::unordered_map<T, U, Args...>* c) {
   assert(c != nullptr);
   c->clear();
-  return py::ItemsToMap<T, U>(py, [&c](typename std::pair<T, U>&& i) {  //NOLINT: build/c++11
-    // TODO: Use insert_or_assign since c++17
-    (*c)[i.first] = std::move(i.second);
+  if (PyDict_CheckExact(py)) c->reserve(PyDict_Size(py));
+  return py::ItemsToMap<T, U>(py, [&c](T&& k, U&& v) {  //NOLINT: build/c++11
+#if __cplusplus >= 201703L
+    c->insert_or_assign(std::move(k), std::move(v));
+#else
+    (*c)[std::move(k)] = std::move(v);
+#endif
   });
 }
 template<typename T, typename U, typename... Args>
 bool Clif_PyObjAs(PyObject* py, std::map<T, U, Args...>* c) {
   assert(c != nullptr);
   c->clear();
-  return py::ItemsToMap<T, U>(py, [&c](typename std::pair<T, U>&& i) {  //NOLINT: build/c++11
-    (*c)[i.first] = std::move(i.second);
+  return py::ItemsToMap<T, U>(py, [&c](T&& k, U&& v) {  //NOLINT: build/c++11
+#if __cplusplus >= 201703L
+    c->insert_or_assign(std::move(k), std::move(v));
+#else
+    (*c)[std::move(k)] = std::move(v);
+#endif
   });
 }
 }  // namespace clif
@@ -0,0 +1,300 @@
+// Copyright 2017 Google Inc.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//      http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <map>
+#include <string>
+#include <thread>  // NOLINT(build/c++11)
+#include <tuple>
+#include <utility>
+#include <vector>
+
+#include "clif/python/types.h"
+#include "clif/python/stltypes.h"
+#include "testing/base/public/gunit.h"
+
+namespace clif {
+namespace {
+
+class BatchedFuncTest : public ::testing::Test {
+ protected:
+  BatchedFuncTest() {
+    Py_Initialize();
+#if PY_VERSION_HEX < 0x03070000
+    PyEval_InitThreads();
+#endif
+    calls_ = PyList_New(0);
+    append_ = PyObject_GetAttrString(calls_, "append");
+  }
+  ~BatchedFuncTest() override {
+    Py_DECREF(append_);
+    Py_DECREF(calls_);
+  }
+
+  PyObject* calls_;
+  PyObject* append_;
+};
+
+TEST_F(BatchedFuncTest, CallWithGil) {
+  callback::BatchedFunc<int> f(append_);
+  f(1);
+  ASSERT_EQ(1, PyList_GET_SIZE(calls_));
+  int v;
+  ASSERT_TRUE(Clif_PyObjAs(PyList_GET_ITEM(calls_, 0), &v));
+  EXPECT_EQ(1, v);
+}
+
+TEST_F(BatchedFuncTest, QueuedWithoutGil) {
+  callback::BatchedFunc<const std::string&> f(append_);
+  PyThreadState* state = PyEval_SaveThread();
+  std::thread worker([&f] {
+    for (int i = 0; i < 3; ++i) {
+      // The temporary is gone by the time the queued call runs.
+      f(std::string(100, 'a' + i));
+    }
+  });
+  worker.join();
+  PyEval_RestoreThread(state);
+  FlushCallbacks();
+  ASSERT_EQ(3, PyList_GET_SIZE(calls_));
+  for (int i = 0; i < 3; ++i) {
+    std::string s;
+    ASSERT_TRUE(Clif_PyObjAs(PyList_GET_ITEM(calls_, i), &s));
+    EXPECT_EQ(std::string(100, 'a' + i), s);
+  }
+}
+
+TEST_F(BatchedFuncTest, ArgumentsAreQueueable) {
+  EXPECT_TRUE((callback::AreQueueable<int, const std::string&>::value));
+  EXPECT_FALSE((callback::AreQueueable<int, const char*>::value));
+  EXPECT_FALSE((callback::AreQueueable<std::string&&>::value));
+  EXPECT_FALSE((callback::AreQueueable<std::unique_ptr<int>>::value));
+}
+
+int Twice(int i) { return 2 * i; }
+
+// Python function for a std::function<int(int)> in |caps|, as generated by
+// CallableType.
+PyObject* CallIntFunc(PyObject* caps, PyObject* args) {
+  int i;
+  if (!PyArg_ParseTuple(args, "i", &i)) return nullptr;
+  void* f = PyCapsule_GetPointer(caps, typeid(std::function<int(int)>).name());
+  if (f == nullptr) return nullptr;
+  return PyLong_FromLong((*static_cast<std::function<int(int)>*>(f))(i));
+}
+
+PyMethodDef kIntFunc = {C("f"), CallIntFunc, METH_VARARGS, nullptr};
+
+class ConversionTest : public ::testing::Test {
+ protected:
+  ConversionTest() {
+    Py_Initialize();
+    globals_ = PyModule_GetDict(PyImport_AddModule("__main__"));
+  }
+
+  // Returns a new reference to the value of Python expression |expr|.
+  PyObject* Eval(const char* expr) {
+    PyObject* py = PyRun_String(expr, Py_eval_input, globals_, globals_);
+    EXPECT_NE(nullptr, py) << expr;
+    return py;
+  }
+
+  void Exec(const char* code) {
+    PyObject* py = PyRun_String(code, Py_file_input, globals_, globals_);
+    ASSERT_NE(nullptr, py) << code;
+    Py_DECREF(py);
+  }
+
+  // Returns true if |expr| does not convert to T and sets |exc|.
+  template<typename T>
+  bool Fails(const char* expr, PyObject* exc) {
+    PyObject* py = Eval(expr);
+    T c;
+    bool ok = Clif_PyObjAs(py, &c);
+    Py_DECREF(py);
+    bool matches = !ok && PyErr_ExceptionMatches(exc);
+    PyErr_Clear();
+    return matches;
+  }
+
+  PyObject* globals_;  // Borrowed.
+};
+
+TEST_F(ConversionTest, PairFromSequence) {
+  std::pair<int, double> p;
+  for (const char* expr : {"[1, 2.5]", "(1, 2.5)"}) {
+    PyObject* py = Eval(expr);
+    ASSERT_TRUE(Clif_PyObjAs(py, &p)) << expr;
+    Py_DECREF(py);
+    EXPECT_EQ(1, p.first);
+    EXPECT_EQ(2.5, p.second);
+  }
+  // Other sequences use the sequence protocol without leaking the items.
+  Exec("class Seq(object):\n"
+       "  item = 12345678\n"
+       "  def __len__(self): return 2\n"
+       "  def __getitem__(self, i):\n"
+       "    if i > 1: raise IndexError(i)\n"
+       "    return self.item\n");
+  PyObject* item = Eval("Seq.item");
+  Py_ssize_t refcnt = Py_REFCNT(item);
+  PyObject* py = Eval("Seq()");
+  ASSERT_TRUE(Clif_PyObjAs(py, &p));
+  Py_DECREF(py);
+  EXPECT_EQ(12345678, p.first);
+  EXPECT_EQ(refcnt, Py_REFCNT(item));
+  Py_DECREF(item);
+}
+
+TEST_F(ConversionTest, PairErrors) {
+  using Pair = std::pair<int, int>;
+  EXPECT_TRUE(Fails<Pair>("[1, 2, 3]", PyExc_ValueError));
+  EXPECT_TRUE(Fails<Pair>("(1,)", PyExc_ValueError));
+  EXPECT_TRUE(Fails<Pair>("{1, 2}", PyExc_TypeError));
+  EXPECT_TRUE(Fails<Pair>("{1: 2, 3: 4}", PyExc_TypeError));
+  EXPECT_TRUE(Fails<Pair>("1", PyExc_TypeError));
+  // A generator is rejected without consuming it.
+  Exec("gen = (i for i in [1, 2])");
+  EXPECT_TRUE(Fails<Pair>("gen", PyExc_TypeError));
+  PyObject* first = Eval("next(gen)");
+  int v;
+  ASSERT_TRUE(Clif_PyObjAs(first, &v));
+  Py_DECREF(first);
+  EXPECT_EQ(1, v);
+}
+
+TEST_F(ConversionTest, TupleFromSequence) {
+  std::tuple<int, double, int> t;
+  for (const char* expr : {"[1, 2.5, 3]", "(1, 2.5, 3)"}) {
+    PyObject* py = Eval(expr);
+    ASSERT_TRUE(Clif_PyObjAs(py, &t)) << expr;
+    Py_DECREF(py);
+    EXPECT_EQ(1, std::get<0>(t));
+    EXPECT_EQ(2.5, std::get<1>(t));
+    EXPECT_EQ(3, std::get<2>(t));
+  }
+  using Tuple = std::tuple<int, int>;
+  EXPECT_TRUE(Fails<Tuple>("(1, 2, 3)", PyExc_ValueError));
+  EXPECT_TRUE(Fails<Tuple>("[1]", PyExc_ValueError));
+  EXPECT_TRUE(Fails<Tuple>("{1, 2}", PyExc_TypeError));
+  EXPECT_TRUE(Fails<Tuple>("None", PyExc_TypeError));
+  EXPECT_TRUE(Fails<Tuple>("(1, 'a')", PyExc_TypeError));
+}
+
+TEST_F(ConversionTest, VectorFromBuffer) {
+  Exec("from array import array");
+  std::vector<double> d;
+  PyObject* py = Eval("array('d', [1.5, 2.5])");
+  ASSERT_TRUE(Clif_PyObjAs(py, &d));
+  Py_DECREF(py);
+  EXPECT_EQ(std::vector<double>({1.5, 2.5}), d);
+
+  std::vector<uint8_t> b;
+  py = Eval("b'\\x01\\x02\\xff'");
+  ASSERT_TRUE(Clif_PyObjAs(py, &b));
+  Py_DECREF(py);
+  EXPECT_EQ(std::vector<uint8_t>({1, 2, 255}), b);
+
+  // A format or item size mismatch converts item by item.
+  py = Eval("array('i', [1, 2, 3])");
+  ASSERT_TRUE(Clif_PyObjAs(py, &d));
+  Py_DECREF(py);
+  EXPECT_EQ(std::vector<double>({1, 2, 3}), d);
+  std::vector<int> i;
+  py = Eval("array('h', [4, -5])");
+  ASSERT_TRUE(Clif_PyObjAs(py, &i));
+  Py_DECREF(py);
+  EXPECT_EQ(std::vector<int>({4, -5}), i);
+}
+
+TEST_F(ConversionTest, MapFromDict) {
+  std::map<int, int> m;
+  PyObject* py = Eval("{1: 2, 3: 4}");
+  ASSERT_TRUE(Clif_PyObjAs(py, &m));
+  Py_DECREF(py);
+  EXPECT_EQ((std::map<int, int>{{1, 2}, {3, 4}}), m);
+
+  // Other mappings are converted via items().
+  Exec("class Dict(dict): pass\n"
+       "class Mapping(object):\n"
+       "  def items(self): return iter([(5, 6)])\n"
+       "  iteritems = items\n");
+  py = Eval("Dict({1: 2})");
+  ASSERT_TRUE(Clif_PyObjAs(py, &m));
+  Py_DECREF(py);
+  EXPECT_EQ((std::map<int, int>{{1, 2}}), m);
+  py = Eval("Mapping()");
+  ASSERT_TRUE(Clif_PyObjAs(py, &m));
+  Py_DECREF(py);
+  EXPECT_EQ((std::map<int, int>{{5, 6}}), m);
+}
+
+TEST_F(ConversionTest, MapFromDictChangedByConversion) {
+  // Converting a Changer value to a list calls change().
+  Exec("class Changer(object):\n"
+       "  def __init__(self, change): self.change = change\n"
+       "  def __iter__(self):\n"
+       "    self.change()\n"
+       "    return iter([1])\n");
+  using Map = std::map<int, std::vector<int>>;
+  Exec("d = {1: Changer(lambda: d.pop(2)), 2: []}");
+  EXPECT_TRUE(Fails<Map>("d", PyExc_RuntimeError));
+  // Same size, but the seen key 1 was replaced with 4.
+  Exec("d = {1: [], 2: Changer(lambda: (d.pop(1), d.setdefault(4, [])))}");
+  EXPECT_TRUE(Fails<Map>("d", PyExc_RuntimeError));
+}
+
+TEST_F(ConversionTest, FunctionPassedBack) {
+  PyObject* caps = FunctionCapsule(std::function<int(int)>(Twice));
+  ASSERT_NE(nullptr, caps);
+  PyObject* py = PyCFunction_New(&kIntFunc, caps);
+  Py_DECREF(caps);
+  ASSERT_NE(nullptr, py);
+  // Same signature: the C++ function is taken back.
+  std::function<int(int)> same;
+  ASSERT_TRUE(Clif_PyObjAs(py, &same));
+  auto* target = same.target<int(*)(int)>();
+  ASSERT_NE(nullptr, target);
+  EXPECT_EQ(&Twice, *target);
+  // Other signature: called as any Python callable.
+  std::function<double(long)> other;  // NOLINT(runtime/int)
+  ASSERT_TRUE(Clif_PyObjAs(py, &other));
+  EXPECT_EQ(nullptr, other.target<int(*)(int)>());
+  EXPECT_NE(nullptr, (other.target<callback::Func<double, long>>()));
+  EXPECT_EQ(6.0, other(3));
+  Py_DECREF(py);
+  // A Python function is never unwrapped.
+  py = Eval("lambda i: i + 1");
+  ASSERT_TRUE(Clif_PyObjAs(py, &same));
+  Py_DECREF(py);
+  EXPECT_EQ(nullptr, same.target<int(*)(int)>());
+  EXPECT_EQ(4, same(3));
+}
+
+#if PY_MAJOR_VERSION >= 3
+TEST_F(ConversionTest, VectorFromNonContiguousBuffer) {
+  Exec("from array import array");
+  std::vector<double> d;
+  PyObject* py = Eval("memoryview(array('d', [1, 2, 3, 4]))[::2]");
+  ASSERT_TRUE(Clif_PyObjAs(py, &d));
+  Py_DECREF(py);
+  EXPECT_EQ(std::vector<double>({1, 3}), d);
+  // A 0-d buffer holds a scalar, not a list.
+  EXPECT_TRUE(Fails<std::vector<double>>(
+      "memoryview(array('d', [2])).cast('B').cast('d', shape=[])",
+      PyExc_TypeError));
+}
+#endif  // PY_MAJOR_VERSION >= 3
+
+}  // namespace
+}  // namespace clif
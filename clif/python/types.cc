@@ -14,15 +14,107 @@
 
 #include "clif/python/types.h"
 #include <climits>
+#include <cstdlib>
 
 namespace clif {
 
 //// To Python conversions.
 
+namespace {
+
+// Strings longer than that are not cached by InternedStr.
+constexpr size_t kInternedMaxSize = 64;
+// The InternedStr cache starts over when it has that many strings.
+constexpr size_t kInternedMaxCount = 8192;
+
+// Short strings returned by InternedStrFrom. They are not interned: Python
+// 3.12 makes interned strings immortal, so the cache would not bound memory.
+std::unordered_map<std::string, PyObject*>* interned_strs = nullptr;
+
+PyObject* ClearInternedStrs(PyObject*, PyObject*) {
+  for (auto& i : *interned_strs) Py_DECREF(i.second);
+  interned_strs->clear();
+  Py_RETURN_NONE;
+}
+
+// Release the cached strings at exit while Python can still free them (a
+// Py_AtExit function runs after finalization). If that fails they are kept.
+void ClearInternedStrsAtExit() {
+  static PyMethodDef clear = {"_clear_istr_cache", ClearInternedStrs,
+                              METH_NOARGS, nullptr};
+  PyObject* atexit = PyImport_ImportModule("atexit");
+  PyObject* reg = atexit ? PyObject_GetAttrString(atexit, "register")
+                         : nullptr;
+  PyObject* f = reg ? PyCFunction_New(&clear, nullptr) : nullptr;
+  PyObject* r = f ? PyObject_CallFunctionObjArgs(reg, f, nullptr) : nullptr;
+  if (r == nullptr) PyErr_Clear();
+  Py_XDECREF(r);
+  Py_XDECREF(f);
+  Py_XDECREF(reg);
+  Py_XDECREF(atexit);
+}
+
+// Return a native str of |s|, shared if |s| is short.
+// Called with the GIL held.
+PyObject* InternedStrFrom(const char* data, size_t size) {
+  if (interned_strs == nullptr) {
+    interned_strs = new std::unordered_map<std::string, PyObject*>;
+    ClearInternedStrsAtExit();
+  }
+  std::string s;
+  if (size <= kInternedMaxSize) {
+    s.assign(data, size);
+    auto it = interned_strs->find(s);
+    if (it != interned_strs->end()) {
+      Py_INCREF(it->second);
+      return it->second;
+    }
+  }
+#if PY_MAJOR_VERSION < 3
+  PyObject* py = PyString_FromStringAndSize(data, size);
+#else
+  PyObject* py = PyUnicode_DecodeUTF8(data, size, nullptr);
+#endif
+  if (py == nullptr || size > kInternedMaxSize) return py;
+  if (interned_strs->size() >= kInternedMaxCount) {
+    for (auto& i : *interned_strs) Py_DECREF(i.second);
+    interned_strs->clear();
+  }
+  Py_INCREF(py);
+  interned_strs->emplace(std::move(s), py);
+  return py;
+}
+
+// Size of the smallest blob result moved to a memoryview.
+size_t BlobViewMinSize() {
+  static const size_t size = [] {
+    const char* env = getenv("CLIF_BLOB_VIEW_MIN_SIZE");
+    return env != nullptr && env[0] != '\0' ? strtoull(env, nullptr, 10)
+                                             : size_t(1) << 20;
+  }();
+  return size;
+}
+}  // namespace
+
 // bytes
 PyObject* Clif_PyObjFrom(const std::string& c, py::PostConv pc) {
+  // Decode str/unicode in one step instead of UnicodeFromBytes(bytes).
+  if (pc.Is(UnicodeFromBytes)) {
+    return PyUnicode_DecodeUTF8(c.data(), c.size(), nullptr);
+  }
+  if (pc.Is(InternedStr)) return InternedStrFrom(c.data(), c.size());
   return pc.Apply(PyBytes_FromStringAndSize(c.data(), c.size()));
 }
+PyObject* Clif_PyObjFrom(std::string&& c, py::PostConv pc) {
+  if (pc.Is(Blob) && c.size() >= BlobViewMinSize()) {
+    std::string* s = new std::string(std::move(c));
+    const Py_ssize_t shape[] = {static_cast<Py_ssize_t>(s->size())};
+    return python::MemoryView(
+        &(*s)[0], 1, shape, 1, "B", s,
+        [](void* p) { delete static_cast<std::string*>(p); }, true);
+  }
+  return Clif_PyObjFrom(static_cast<const std::string&>(c), pc);
+}
 PyObject* UnicodeFromBytes(PyObject* b) {
   if (!b || PyUnicode_Check(b)) return b;
   if (!PyBytes_Check(b)) {
@@ -35,6 +127,34 @@ PyObject* UnicodeFromBytes(PyObject* b) {
   Py_DECREF(b);
   return u;
 }
+PyObject* Blob(PyObject* b) {
+  return b;
+}
+PyObject* InternedStr(PyObject* b) {
+  if (!b) return b;
+  const char* data;
+  Py_ssize_t size;
+#if PY_MAJOR_VERSION >= 3
+  if (PyUnicode_CheckExact(b)) {
+    data = PyUnicode_AsUTF8AndSize(b, &size);
+    if (data == nullptr) {
+      Py_DECREF(b);
+      return nullptr;
+    }
+  } else  //NOLINT readability/braces
+#endif
+  if (PyBytes_Check(b)) {
+    data = PyBytes_AS_STRING(b);
+    size = PyBytes_GET_SIZE(b);
+  } else {
+    PyErr_Format(PyExc_TypeError, "expecting bytes, got %s", ClassName(b));
+    Py_DECREF(b);
+    return nullptr;
+  }
+  PyObject* s = InternedStrFrom(data, size);
+  Py_DECREF(b);
+  return s;
+}
 
 
 //// From Python conversions.
@@ -258,17 +378,29 @@ namespace py {
 // bytes/unicode
 template<typename C>
 bool ObjToStr(PyObject* py, C copy ) {
-  bool decref = false;
+#if PY_MAJOR_VERSION >= 3
+  if (PyUnicode_Check(py)) {
+    // Use the UTF-8 encoding cached in |py| (no temporary bytes object).
+    Py_ssize_t length;
+    const char* data = PyUnicode_AsUTF8AndSize(py, &length);
+    if (!data) return false;
+    copy(data, length);
+    return true;
+  }
+#else
   if (PyUnicode_Check(py)) {
     py = PyUnicode_AsUTF8String(py);
     if (!py) return false;
-    decref = true;
-  } else if (!PyBytes_Check(py)) {
+    copy(PyBytes_AS_STRING(py), PyBytes_GET_SIZE(py));
+    Py_DECREF(py);
+    return true;
+  }
+#endif
+  if (!PyBytes_Check(py)) {
     PyErr_SetString(PyExc_TypeError, "expecting str");
     return false;
   }
   copy(PyBytes_AS_STRING(py), PyBytes_GET_SIZE(py));
-  if (decref) Py_DECREF(py);
   return true;
 }
 }  // namespace py
@@ -278,4 +410,32 @@ bool Clif_PyObjAs(PyObject* p, std::string* c) {
   return py::ObjToStr(p,
       [c](const char* data, size_t length) { c->assign(data, length); });
 }
+
+bool ObjToStrData(PyObject* py, const char** data, Py_ssize_t* size,
+                  Py_buffer* view) {
+  assert(data != nullptr && size != nullptr);
+  if (PyBytes_Check(py)) {
+    *data = PyBytes_AS_STRING(py);
+    *size = PyBytes_GET_SIZE(py);
+    return true;
+  }
+#if PY_MAJOR_VERSION >= 3
+  if (PyUnicode_Check(py)) {
+    *data = PyUnicode_AsUTF8AndSize(py, size);
+    return *data != nullptr;
+  }
+#endif
+  if (view == nullptr || !PyObject_CheckBuffer(py)) {
+    PyErr_Format(PyExc_TypeError, "expecting str, bytes%s, got %s",
+                 view ? " or buffer" : "", ClassName(py));
+    return false;
+  }
+  if (PyObject_GetBuffer(py, view, PyBUF_SIMPLE) < 0) {
+    view->obj = nullptr;
+    return false;
+  }
+  *data = static_cast<const char*>(view->buf);
+  *size = view->len;
+  return true;
+}
 }  // namespace clif
@@ -25,6 +25,7 @@ standard headers on some systems, you must include Python.h before any standard
 headers are included.
 */
 #include <Python.h>
+#include <array>
 #include <map>
 #include <memory>
 #include <set>
@@ -34,6 +35,18 @@ headers are included.
 #include <unordered_set>
 #include <vector>
 #include <type_traits>
+#if __cplusplus >= 201703L
+#include <string_view>
+#endif
+#ifdef __has_include
+#if __has_include("absl/strings/string_view.h")
+#include "absl/strings/string_view.h"
+// absl::string_view is std::string_view with ABSL_USES_STD_STRING_VIEW.
+#ifndef ABSL_USES_STD_STRING_VIEW
+#define CLIF_ABSL_STRING_VIEW
+#endif
+#endif
+#endif
 #include "clif/python/postconv.h"
 #include "clif/python/runtime.h"
 #if PY_MAJOR_VERSION >= 3
@@ -121,6 +134,8 @@ inline PyObject* Clif_PyObjFrom(bool c, py::PostConv pc) {
 
 // CLIF use `std::string` as bytes
 PyObject* Clif_PyObjFrom(const std::string&, py::PostConv);
+// Moves a large string to a memoryview for CLIF type blob (see Blob).
+PyObject* Clif_PyObjFrom(std::string&&, py::PostConv);
 typedef const char* char_ptr;  // A distinct type for constexpr CONST string.
 inline PyObject* Clif_PyObjFrom(const char_ptr c, py::PostConv unused) {
   // Always use native str, ignore postconversion.
@@ -163,7 +178,72 @@ bool Clif_PyObjAs(PyObject*, bool*);
 // bytes
 bool Clif_PyObjAs(PyObject*, std::string*);
 
+// Point |*data| to the content of bytes or str (its cached UTF-8 encoding,
+// Python 3 only) |py| without a copy. The data is valid while |py| is alive.
+// With |view| also to the content of a C-contiguous buffer protocol object |py|
+// (then view->obj is set): the caller must PyBuffer_Release(view) after use.
+bool ObjToStrData(PyObject* py, const char** data, Py_ssize_t* size,
+                  Py_buffer* view = nullptr);
+
+// A string view parameter V of a wrapped C++ function. It can point into a
+// buffer protocol object (like bytearray or mmap), which is held until the
+// call returns, so the object can't be resized or closed meanwhile.
+template <typename V>
+struct StrViewArg {
+  StrViewArg() { buffer.obj = nullptr; }
+  StrViewArg(const StrViewArg&) = delete;
+  StrViewArg& operator=(const StrViewArg&) = delete;
+  ~StrViewArg() {
+    if (buffer.obj != nullptr) PyBuffer_Release(&buffer);
+  }
+  V view;
+  Py_buffer buffer;
+};
+
+template <typename V>
+bool Clif_PyObjAs(PyObject* py, StrViewArg<V>* c) {
+  assert(c != nullptr && c->buffer.obj == nullptr);
+  const char* data;
+  Py_ssize_t size;
+  if (!ObjToStrData(py, &data, &size, &c->buffer)) return false;
+  c->view = V(data, size);
+  return true;
+}
+
+// String views for C++ `bytes` parameters: the matcher keeps the C++ parameter
+// type, so the view points into the argument for the duration of the call.
+// (Not "CLIF use" types: std::string stays the `bytes` default C++ type.)
+// Parameters use StrViewArg, elsewhere views only point into bytes or str.
+#ifdef CLIF_ABSL_STRING_VIEW
+inline bool Clif_PyObjAs(PyObject* py, absl::string_view* c) {
+  assert(c != nullptr);
+  const char* data;
+  Py_ssize_t size;
+  if (!ObjToStrData(py, &data, &size)) return false;
+  *c = absl::string_view(data, size);
+  return true;
+}
+#endif
+
+#if __cplusplus >= 201703L
+inline bool Clif_PyObjAs(PyObject* py, std::string_view* c) {
+  assert(c != nullptr);
+  const char* data;
+  Py_ssize_t size;
+  if (!ObjToStrData(py, &data, &size)) return false;
+  *c = std::string_view(data, size);
+  return true;
+}
+#endif
+
 PyObject* UnicodeFromBytes(PyObject*);
+// Postconversion of CLIF type istr: native str shared for strings that
+// repeat, like labels. Short strings are kept in a bounded cache.
+PyObject* InternedStr(PyObject*);
+// Postconversion of CLIF type blob: bytes as is. A std::string result of at
+// least CLIF_BLOB_VIEW_MIN_SIZE bytes (from the environment, default 1 MiB) is
+// not copied but moved to a read-only memoryview.
+PyObject* Blob(PyObject*);
 
 //
 // Containers
@@ -179,6 +259,10 @@ template<typename T, typename... Args>
 PyObject* Clif_PyObjFrom(const std::vector<T, Args...>& c, py::PostConv);
 template<typename T, typename... Args>
 bool Clif_PyObjAs(PyObject* py, std::vector<T, Args...>* c);
+template<typename T, std::size_t N>
+PyObject* Clif_PyObjFrom(const std::array<T, N>& c, py::PostConv);
+template<typename T, std::size_t N>
+bool Clif_PyObjAs(PyObject* py, std::array<T, N>* c);
 
 // CLIF use `std::pair` as tuple
 template<typename T, typename U>
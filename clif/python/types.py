@@ -60,7 +60,8 @@ class ClassType(TypeDef):
   """C++ class as Python type."""
 
   def __init__(self, cpp_name, pypath, wclass, wtype, wnamespace,
-               can_copy, can_destruct, down_cast, virtual, ns=None):
+               can_copy, can_destruct, down_cast, virtual, ns=None,
+               value=False, identity=False):
     """Register a new class.
 
     Args:
@@ -74,6 +75,10 @@ class ClassType(TypeDef):
       down_cast: None of FQ C++ [replacement] class (another:FooCpp)
       virtual: True if class has @virtual method(s) and needs a redirector
       ns: namespace where class defined
+      value: True if C++ instance stored in the wrapper (@value), so it's
+        always copied in and out (instead of shared)
+      identity: True if wrappers are registered by C++ instance address
+        (@identity), so the same instance gets the same Python object
     """
     TypeDef.__init__(self, cpp_name, pypath, ns)
     self.wrapper_obj = wclass
@@ -81,9 +86,18 @@ class ClassType(TypeDef):
     self.wrapper_ns = wnamespace
     self.down_cast = down_cast
     self.virtual = virtual
+    self.value = value
+    self.identity = identity
     # Argument list for Clif_PyObjFrom().
     self._from = []  # [C++ Argument, Can get NULL, Init expression]
-    if not virtual:
+    if value:
+      # Init is Emplace() args.
+      self._from = [
+          ('%s*', True, '*c'),
+          ('std::unique_ptr<%s>', True, 'std::move(*c)'),
+          ('std::shared_ptr<%s>', True, '*c'),
+          ('const %s&', False, 'c')]
+    elif not virtual:
       self._from = [
           ('%s*', True, '::clif::SharedPtr<%s>(c, ::clif::UnOwnedResource());')]
       if can_destruct:
@@ -103,6 +117,8 @@ class ClassType(TypeDef):
     self._as = [  # [C++ Argument, prefix, postfix]
         ('%s*', '', ''),
         ('std::shared_ptr<%s>', '::clif::MakeStdShared(', ', cpp)')]
+    if value:
+      self._as[1] = ('std::shared_ptr<%s>', 'std::make_shared<%s>(*', ')')
     if can_destruct:
       self._as.append(('std::unique_ptr<%s>', '', ''))
     if can_copy and not virtual:
@@ -145,7 +161,9 @@ class ClassType(TypeDef):
                                                   ns, self.wrapper_ns)
         yield I+'if (cpp == nullptr) return false;'
         if '%s' in ptr: ptr %= self.cname
-        if arg == 'std::unique_ptr<%s>':
+        if arg == 'std::unique_ptr<%s>' and self.value:
+          yield I+'c->reset(new %s(*cpp));' % self.cname
+        elif arg == 'std::unique_ptr<%s>':
           yield I+'if (!%s.Detach()) {' % shared
           yield I+I+('PyErr_SetString(PyExc_ValueError, '
                      '"Cannot convert %s instance to std::unique_ptr.");' %
@@ -154,7 +172,8 @@ class ClassType(TypeDef):
           yield I+'}'
           yield I+'c->reset(cpp);'
         else:
-          c = shared if arg == 'std::shared_ptr<%s>' else 'cpp'
+          c = (shared if arg == 'std::shared_ptr<%s>' and not self.value
+               else 'cpp')
           yield I+'*c = %s%s%s;' % (ptr, c, get)
         yield I+'return true;'
       else:
@@ -170,12 +189,33 @@ class ClassType(TypeDef):
           arg % self.cname)
       if ptr:
         yield I+'if (c == nullptr) Py_RETURN_NONE;'
-      yield I+'PyObject* py = PyType_GenericNew(&%s, NULL, NULL);' % pytype
-      cname = ns+'::'+self.virtual if self.virtual else self.cname
-      init %= (cname,) * init.count('%s')
-      yield I+shared+' = '+init
-      if self.virtual:
-        yield I+shared+'->::clif::PyObj::Init(py);'
+      registry = '%s::%s_registry' % (ns, self.wrapper_ns)
+      if self.identity and arg in ('%s*', 'std::shared_ptr<%s>'):
+        # Reuse the alive wrapper of that instance (if it still holds it).
+        if arg == '%s*':
+          yield I+'PyObject* py = %s.Find(c);' % registry
+          yield I+'if (py != nullptr && %s.get() == c) {' % shared
+        else:
+          # Only a wrapper sharing the ownership keeps the pointee alive.
+          yield I+'PyObject* py = %s.Find(c.get());' % registry
+          yield I+'if (py != nullptr && ::clif::SharesOwnership(%s, c)) {' % (
+              shared)
+        yield I+I+'Py_INCREF(py);'
+        yield I+I+'return py;'
+        yield I+'}'
+        yield I+'py = PyType_GenericNew(&%s, NULL, NULL);' % pytype
+      else:
+        yield I+'PyObject* py = PyType_GenericNew(&%s, NULL, NULL);' % pytype
+      if self.value:
+        yield I+shared+'.Emplace(%s);' % init
+      else:
+        cname = ns+'::'+self.virtual if self.virtual else self.cname
+        init %= (cname,) * init.count('%s')
+        yield I+shared+' = '+init
+        if self.virtual:
+          yield I+shared+'->::clif::PyObj::Init(py);'
+        if self.identity:
+          yield I+'%s.Add(%s.get(), py);' % (registry, shared)
       yield I+'return py;'
       yield '}'
     if self.down_cast:
@@ -191,16 +231,17 @@ class EnumType(TypeDef):
   """C++ enum and enum class as Python enum-derived object."""
   _genclifuse = True
 
-  def __init__(self, cpp_name, pyname, pytype, wname, ns=None):
+  def __init__(self, cpp_name, pyname, pytype, wname, ns=None, native=False):
     # args like (ns::FooCpp, X.Y.Foo, Enum/IntEnum, X::Y::_Foo)
     TypeDef.__init__(self, cpp_name, pyname, ns)
     self.wrapper_type = pytype
     self.wrapper_name = wname
+    self.native = native  # Use CLIF runtime int-derived enum class.
 
-  def CreateEnum(self, ns, wname, varname, items, py3=False):
+  def CreateEnum(self, ns, wname, varname, items, py3=False, module=''):
     """Generate a function to create Enum-derived class and a cache var."""
-    yield '// Create Python Enum object (cached in %s) for %s' % (varname,
-                                                                  self.cname)
+    yield '// Create Python %s object (cached in %s) for %s' % (
+        'native enum' if self.native else 'Enum', varname, self.cname)
     yield 'static PyObject* %s() {' % wname
     yield I+('PyObject *py, *py_enum_class{}, *names = PyTuple_New(%d);'
              % len(items))
@@ -209,13 +250,17 @@ class EnumType(TypeDef):
       yield I+'if ((py = Py_BuildValue("(NN)", %s, %s)' % pair
       yield I+I+I+') == nullptr) goto err;'
       yield I+'PyTuple_SET_ITEM(names, %d, py);' % i
-    if py3:
-      yield I+'py = PyUnicode_FromString("%s");' % self.pyname
+    if self.native:
+      yield I+('py_enum_class = ::clif::python::NewEnum("%s", "%s", names);'
+               % (self.pyname, module))
     else:
-      yield I+'py = PyString_FromString("%s");' % self.pyname
-    yield I+('py_enum_class = PyObject_CallFunctionObjArgs(%s::_%s, py, names, '
-             'nullptr);' % (ns, self.wrapper_type))
-    yield I+'Py_DECREF(py);'
+      if py3:
+        yield I+'py = PyUnicode_FromString("%s");' % self.pyname
+      else:
+        yield I+'py = PyString_FromString("%s");' % self.pyname
+      yield I+('py_enum_class = PyObject_CallFunctionObjArgs(%s::_%s, py, '
+               'names, nullptr);' % (ns, self.wrapper_type))
+      yield I+'Py_DECREF(py);'
     yield 'err:'
     yield I+'Py_DECREF(names);'
     yield I+'return py_enum_class;'
@@ -237,16 +282,24 @@ class EnumType(TypeDef):
     yield I+I+'return false;'
     yield I+'}'
     yield I+EnumIntType(self.cname)+' v;'
-    yield I+'PyObject* value = PyObject_GetAttrString(py, "value");'
-    yield I+'if (value == nullptr || !Clif_PyObjAs(value, &v)) return false;'
-    yield I+'Py_DECREF(value);'
+    if self.native:
+      # Native enum members are ints.
+      yield I+'if (!Clif_PyObjAs(py, &v)) return false;'
+    else:
+      yield I+'PyObject* value = PyObject_GetAttrString(py, "value");'
+      yield I+'if (value == nullptr || !Clif_PyObjAs(value, &v)) return false;'
+      yield I+'Py_DECREF(value);'
     yield I+'*c = %s;' % AsType(self.cname, 'v')
     yield I+'return true;'
     yield '}'
     yield ''
     yield 'PyObject* Clif_PyObjFrom(const %s& c, py::PostConv) {' % self.cname
-    yield I+'return PyObject_CallFunctionObjArgs(%s, PyInt_FromLong(' % wname
-    yield I+I+I+AsType(EnumIntType(self.cname), 'c')+'), nullptr);'
+    if self.native:
+      yield I+'return ::clif::python::EnumFromValue(%s, PyInt_FromLong(' % wname
+      yield I+I+I+AsType(EnumIntType(self.cname), 'c')+'));'
+    else:
+      yield I+'return PyObject_CallFunctionObjArgs(%s, PyInt_FromLong(' % wname
+      yield I+I+I+AsType(EnumIntType(self.cname), 'c')+'), nullptr);'
     yield '}'
 
 
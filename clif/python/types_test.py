@@ -57,6 +57,42 @@ class TypesTest(unittest.TestCase):
       PyObject* Clif_PyObjFrom(const c::name::cpp_name&, py::PostConv) = delete;
     """))
 
+  def testClassTypeValue(self):
+    ns = 'clif::name::'
+    w = ns+'wrapper'
+    t = types.ClassType('c::name::cpp_name', 'fq.py.path', w, w+'_Type', ns,
+                        can_copy=True, can_destruct=True,
+                        down_cast=None, virtual='', value=True)
+    header = '\n'.join(t.GenHeader()) + '\n'
+    self.assertMultiLineEqual(header, textwrap.dedent("""\
+      // CLIF use `c::name::cpp_name` as fq.py.path
+      bool Clif_PyObjAs(PyObject* input, c::name::cpp_name** output);
+      bool Clif_PyObjAs(PyObject* input, std::shared_ptr<c::name::cpp_name>* output);
+      bool Clif_PyObjAs(PyObject* input, std::unique_ptr<c::name::cpp_name>* output);
+      bool Clif_PyObjAs(PyObject* input, c::name::cpp_name* output);
+      bool Clif_PyObjAs(PyObject* input, ::gtl::optional<c::name::cpp_name>* output);
+      PyObject* Clif_PyObjFrom(c::name::cpp_name*, py::PostConv);
+      PyObject* Clif_PyObjFrom(std::unique_ptr<c::name::cpp_name>, py::PostConv);
+      PyObject* Clif_PyObjFrom(std::shared_ptr<c::name::cpp_name>, py::PostConv);
+      PyObject* Clif_PyObjFrom(const c::name::cpp_name&, py::PostConv);
+    """))
+    code = '\n'.join(t.GenConverters('m'))
+    self.assertIn('*c = std::make_shared<c::name::cpp_name>(*cpp);', code)
+    self.assertIn('c->reset(new c::name::cpp_name(*cpp));', code)
+    self.assertIn('->cpp.Emplace(std::move(*c));', code)
+    self.assertNotIn('SharedPtr', code)
+
+  def testClassTypeIdentity(self):
+    ns = 'clif::name::'
+    w = ns+'wrapper'
+    t = types.ClassType('c::name::cpp_name', 'fq.py.path', w, w+'_Type', ns,
+                        can_copy=True, can_destruct=True,
+                        down_cast=None, virtual='', identity=True)
+    code = '\n'.join(t.GenConverters('m'))
+    self.assertIn('PyObject* py = m::clif::name::_registry.Find(c);', code)
+    self.assertIn('::clif::SharesOwnership(', code)
+    self.assertEqual(code.count('m::clif::name::_registry.Add('), 4)
+
   def testEnumType(self):
     t = types.EnumType('c::name::cpp_name', 'fq.py.path', 'Enum', 'clif::_Type')
     header = '\n'.join(t.GenHeader()) + '\n'